@@ -0,0 +1,113 @@
+class Tween:
+    """
+    one scheduled animation: on_update receives the progress (0 to 1) every frame for duration seconds,
+    then on_done is called once
+    """
+
+    def __init__(self, duration, on_update=None, on_done=None, delay=0.0):
+        self.duration = duration
+        self.on_update = on_update
+        self.on_done = on_done
+        self.delay = delay
+        self.elapsed = 0.0
+        self.done = False
+
+    def advance(self, dt):
+        """
+        move the animation forward
+        :param dt: seconds since the last frame
+        :return: True once finished
+        """
+        if self.delay > 0:
+            self.delay -= dt
+            if self.delay > 0:
+                return False
+            dt = -self.delay  # the part of the frame left after the delay
+        self.elapsed += dt
+        progress = 1.0 if self.duration <= 0 else min(self.elapsed / self.duration, 1.0)
+        if self.on_update is not None:
+            self.on_update(progress)
+        if progress >= 1.0:
+            self.done = True
+            if self.on_done is not None:
+                self.on_done()
+        return self.done
+
+
+class Scheduler:
+    """
+    runs any number of tweens side by side, driven by the frame time of the main loop instead of
+    blocking waits, so input keeps being handled while something animates
+    """
+
+    def __init__(self):
+        self.tweens = []
+        self.new = set()  # tweens scheduled since begin_frame()
+
+    @property
+    def active(self):
+        return bool(self.tweens)
+
+    @property
+    def moving(self):
+        """
+        :return: True if an animation is running, not just waiting for its delay to pass
+        """
+        return any(tween.delay <= 0 for tween in self.tweens)
+
+    def next_start(self):
+        """
+        :return: seconds until the first delayed tween starts, None if nothing is waiting
+        """
+        return min((tween.delay for tween in self.tweens if tween.delay > 0), default=None)
+
+    def animate(self, duration, on_update=None, on_done=None, delay=0.0):
+        """
+        schedule an animation
+        :param duration: seconds
+        :param on_update: called with the progress (0 to 1) every frame
+        :param on_done: called once at the end
+        :param delay: seconds to wait before starting
+        :return: the tween (can be passed to cancel)
+        """
+        tween = Tween(duration, on_update, on_done, delay)
+        self.tweens.append(tween)
+        self.new.add(tween)
+        return tween
+
+    def after(self, delay, callback):
+        """
+        call a function after a delay without blocking
+        :param delay: seconds
+        :param callback:
+        :return: the tween (can be passed to cancel)
+        """
+        return self.animate(0.0, on_done=callback, delay=delay)
+
+    def cancel(self, tween):
+        if tween in self.tweens:
+            self.tweens.remove(tween)
+
+    def clear(self):
+        self.tweens = []
+        self.new.clear()
+
+    def begin_frame(self):
+        """
+        tweens scheduled from now on are new on this frame (see update)
+        :return:
+        """
+        self.new.clear()
+
+    def update(self, dt, new_dt=None):
+        """
+        advance every animation by one frame. callbacks may schedule new animations, those start next frame
+        :param dt: seconds since the last frame
+        :param new_dt: seconds to advance tweens scheduled since begin_frame() by, None for dt. after an idle
+            sleep dt is long, and animations started by this frame's input should begin from 0
+        :return:
+        """
+        for tween in list(self.tweens):
+            step = new_dt if new_dt is not None and tween in self.new else dt
+            if tween in self.tweens and tween.advance(step):
+                self.tweens.remove(tween)
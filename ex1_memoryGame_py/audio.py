@@ -0,0 +1,72 @@
+import pygame
+
+AUDIO_FREQUENCY = 44100
+AUDIO_SIZE = -16  # signed 16 bit samples
+AUDIO_CHANNELS = 2
+AUDIO_BUFFER = 256  # sample frames per mixer callback: 5.8 ms at 44.1 kHz, pygame's default is 512
+FEEDBACK_SOUNDS = ("match", "win")  # each gets a reserved mixer channel, in this order
+
+
+def configure():
+    """
+    low latency mixer settings, must be called before pygame.init() opens the mixer
+    :return:
+    """
+    pygame.mixer.pre_init(AUDIO_FREQUENCY, AUDIO_SIZE, AUDIO_CHANNELS, AUDIO_BUFFER)
+
+
+def open_audio():
+    """
+    :return: Audio, or NullAudio when there is no sound device
+    """
+    if not pygame.mixer.get_init():
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            print(f"audio unavailable ({e}), playing without sound")
+            return NullAudio()
+    return Audio()
+
+
+class NullAudio:
+    """
+    stand-in when audio is unavailable, every call does nothing
+    """
+    available = False
+
+    def load(self, name, sound):
+        pass
+
+    def play(self, name):
+        pass
+
+
+class Audio:
+    """
+    feedback sounds on reserved mixer channels. the sounds are decoded into memory once (pygame Sound)
+    and each one always plays on its own channel, so it starts right away instead of waiting for (or
+    taking) a free channel
+    """
+    available = True
+
+    def __init__(self):
+        pygame.mixer.set_reserved(len(FEEDBACK_SOUNDS))  # Sound.play() never picks these channels
+        self.channels = {name: pygame.mixer.Channel(number) for number, name in enumerate(FEEDBACK_SOUNDS)}
+        self.sounds = {}  # name -> Sound
+
+    def load(self, name, sound):
+        """
+        :param name: one of FEEDBACK_SOUNDS
+        :param sound: decoded Sound, None to play nothing for it
+        :return:
+        """
+        self.sounds[name] = sound
+
+    def play(self, name):
+        """
+        :param name: one of FEEDBACK_SOUNDS
+        :return:
+        """
+        sound = self.sounds.get(name)
+        if sound is not None:
+            self.channels[name].play(sound)
@@ -0,0 +1,318 @@
+import os
+
+# headless: no window and no sound card needed, must be set before pygame is imported
+os.environ["SDL_VIDEODRIVER"] = "dummy"
+os.environ["SDL_AUDIODRIVER"] = "dummy"
+
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import pygame
+
+import memorygame
+from memorygame import MemoryGame, FPS
+from profiler import FrameProfiler
+
+RESULTS_FILE = "benchmark_results.json"
+BASELINE_FILE = "benchmark_baseline.json"
+TOLERANCE = 0.3  # a result more than 30% worse than the baseline (plus the metric's slack) is a regression
+SEED = 1234  # card layout of the scripted game
+DRAW_REPEATS = 500
+STARTUP_RUNS = 5
+MENU_SECONDS = 1
+VOICE_FIXTURES = "voice_fixtures"  # recorded commands for voice_benchmark.py, skipped when missing
+
+# result name -> (unit, absolute slack added to the tolerance, for tiny or noisy values). lower is better
+METRICS = {
+    "draw_board_full_ms": ("ms", 0.05),
+    "draw_board_one_card_ms": ("ms", 0.01),
+    "flip_frame_ms": ("ms", 0.05),
+    "frame_work_mean_ms": ("ms", 0.05),
+    "frame_work_p95_ms": ("ms", 0.2),
+    "dropped_frames": ("frames", 2),
+    "menu_cpu_percent": ("%", 2),
+    "startup_ms": ("ms", 50),
+    "voice_latency_p50_ms": ("ms", 20),
+    "voice_latency_p95_ms": ("ms", 20),
+    "voice_model_load_ms": ("ms", 100),
+}
+
+
+class EventScript:
+    """
+    scripted input: posts events to the pygame queue at fixed times from a background thread, the way
+    the voice thread does, so the game reads them exactly like real input
+    """
+
+    def __init__(self):
+        self.events = []  # (seconds after start, event)
+        self.thread = None
+
+    def at(self, seconds, event):
+        self.events.append((seconds, event))
+        return self
+
+    def click(self, seconds, pos):
+        return self.at(seconds, pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=pos, button=1))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="event-script", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        start = time.perf_counter()
+        for seconds, event in sorted(self.events, key=lambda item: item[0]):
+            time.sleep(max(0, start + seconds - time.perf_counter()))
+            pygame.event.post(event)
+
+
+def card_center(game, index):
+    """
+    :param game:
+    :param index: card index
+    :return: window position of the card center
+    """
+    row, col = divmod(index, game.cols)
+    return (col * (game.card_width + game.gap) + game.card_width // 2,
+            row * (game.card_height + game.gap) + game.card_height // 2)
+
+
+def per_call_ms(function, repeats):
+    """
+    :param function:
+    :param repeats:
+    :return: mean milliseconds per call
+    """
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+def bench_draw_board(game):
+    """
+    draw_board cost for a full repaint and for a single changed card
+    :param game: game with its assets prepared
+    :return: results
+    """
+    def full():
+        game.invalidate()
+        game.draw_board()
+        game.dirty_rects = []
+
+    def one_card():
+        game.card_views[0] = None
+        game.changed_cards = {0}
+        game.draw_board()
+        game.dirty_rects = []
+
+    results = {"draw_board_full_ms": per_call_ms(full, DRAW_REPEATS)}
+    game.update_display()  # ends the full redraw
+    results["draw_board_one_card_ms"] = per_call_ms(one_card, DRAW_REPEATS * 10)
+    return results
+
+
+def bench_flips(game):
+    """
+    cost of one animation frame while every card on the board is flipping, advanced by a fixed 1/FPS
+    :param game:
+    :return: results
+    """
+    game.invalidate()
+    game.draw_board()
+    game.update_display()
+    for index in range(game.rows * game.cols):
+        game.flip_card(index)
+    frames = 0
+    start = time.perf_counter()
+    while game.animations.active:
+        game.animations.update(1 / FPS)
+        game.draw_board()
+        game.update_display()
+        frames += 1
+    elapsed = time.perf_counter() - start
+    game.flips = {}
+    return {"flip_frame_ms": elapsed / frames * 1000}
+
+
+def bench_menu(game):
+    """
+    cpu used by the mode menu while it waits for input, until a scripted click on "1 Player"
+    :param game:
+    :return: results
+    """
+    EventScript().click(MENU_SECONDS, game.rect_list[0].center).start()
+    wall, cpu = time.perf_counter(), time.process_time()
+    game.process_game_mode()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    return {"menu_cpu_percent": cpu / wall * 100}
+
+
+def bench_game_loop(game, frames_output):
+    """
+    frame cost in game_loop while a scripted 1 player game is played to the end: one wrong pair, then
+    every pair, then quit on the win screen
+    :param game: game in 1 player mode
+    :param frames_output: file name (without extension) for the frame profile of the game
+    :return: results
+    """
+    memorygame.MATCH_CHECK_DELAY = 0.2  # shorter pauses, the frames are the same
+    game.state.reset(SEED)
+    game.profiler = FrameProfiler(FPS)
+    game.profile_output = frames_output
+
+    pairs = {}
+    for index, card_id in enumerate(game.state.cards):
+        pairs.setdefault(card_id, []).append(index)
+    pairs = list(pairs.values())
+
+    script = EventScript()
+    seconds = 0.2
+    wrong = (pairs[0][0], pairs[1][0])
+    for pair in [wrong] + pairs:
+        for index in pair:
+            script.click(seconds, card_center(game, index))
+        seconds += 2 * memorygame.FLIP_TIME + memorygame.MATCH_CHECK_DELAY + 0.3
+        if pair is wrong:  # the cards turn back over before the next click
+            seconds += 2 * memorygame.FLIP_TIME
+    script.at(seconds + 0.5, pygame.event.Event(pygame.QUIT))
+    script.start()
+    game.game_loop()
+
+    report = game.profiler.report()
+    if not game.state.is_won():
+        print("warning: the scripted game did not finish")
+    return {"frame_work_mean_ms": report["frame"]["mean"],
+            "frame_work_p95_ms": report["frame"]["p95"],
+            "dropped_frames": report["dropped"]}
+
+
+def bench_startup():
+    """
+    time to the first menu frame of a fresh process (memorygame.py --startup-time)
+    :return: results
+    """
+    times = []
+    for _ in range(STARTUP_RUNS):
+        output = subprocess.run([sys.executable, "memorygame.py", "--startup-time"], capture_output=True,
+                                text=True, check=True).stdout
+        line = [line for line in output.splitlines() if line.startswith("first menu frame")][-1]
+        times.append(float(line.split()[-2]))
+    return {"startup_ms": statistics.median(times)}
+
+
+def bench_voice(fixtures):
+    """
+    voice command latency from recorded wav fixtures (see voice_benchmark.py)
+    :param fixtures: directory of fixtures
+    :return: (results, reason the benchmark was skipped or None)
+    """
+    if not os.path.isdir(fixtures):
+        return {}, f"no fixtures in {fixtures}"
+    try:
+        import voice_benchmark
+        summary = voice_benchmark.run_benchmark(fixtures, verbose=False)
+    except Exception as e:  # vosk missing, model missing, unreadable fixtures
+        return {}, f"voice engine unavailable: {e}"
+    if "latency_p50_ms" not in summary:
+        return {}, "no command was recognized"
+    return {"voice_latency_p50_ms": summary["latency_p50_ms"],
+            "voice_latency_p95_ms": summary["latency_p95_ms"],
+            "voice_model_load_ms": summary["model_load_ms"]}, None
+
+
+def run(fixtures=VOICE_FIXTURES, frames_output="benchmark_frames"):
+    """
+    run the whole suite
+    :param fixtures: voice fixtures directory
+    :param frames_output: file name (without extension) for the frame profile of the scripted game
+    :return: results document
+    """
+    results = bench_startup()
+
+    game = MemoryGame()
+    game.prepare_assets()
+    results.update(bench_draw_board(game))
+    results.update(bench_flips(game))
+    results.update(bench_menu(game))
+    results.update(bench_game_loop(game, frames_output))  # quits pygame at the end
+
+    voice, skipped = bench_voice(fixtures)
+    results.update(voice)
+
+    return {"environment": {"python": platform.python_version(),
+                            "pygame": pygame.version.ver,
+                            "sdl": ".".join(map(str, pygame.get_sdl_version())),
+                            "machine": platform.machine(),
+                            "system": platform.platform()},
+            "results": {name: {"value": round(value, 4), "unit": METRICS[name][0]} for name, value in results.items()},
+            "skipped": {"voice": skipped} if skipped else {}}
+
+
+def compare(document, baseline, tolerance=TOLERANCE):
+    """
+    print every result next to its baseline
+    :param document: results from run()
+    :param baseline: an earlier results document
+    :param tolerance: allowed relative slowdown
+    :return: names of the regressed results
+    """
+    regressions = []
+    for name, result in document["results"].items():
+        value = result["value"]
+        old = baseline["results"].get(name)
+        if old is None:
+            print(f"{name:24} {value:10.3f} {result['unit']:6} (new)")
+            continue
+        limit = old["value"] * (1 + tolerance) + METRICS[name][1]
+        status = "REGRESSION" if value > limit else "ok"
+        if value > limit:
+            regressions.append(name)
+        print(f"{name:24} {value:10.3f} {result['unit']:6} baseline {old['value']:10.3f}  {status}")
+    if baseline["environment"] != document["environment"]:
+        print("note: the baseline was recorded in a different environment")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless memory game benchmarks (run from the game directory)")
+    parser.add_argument("--output", default=RESULTS_FILE, help=f"results file (default {RESULTS_FILE})")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help=f"baseline to compare with (default {BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="allowed slowdown, 0.3 = 30%%")
+    parser.add_argument("--voice-fixtures", default=VOICE_FIXTURES, help="directory of recorded voice commands")
+    args = parser.parse_args()
+
+    document = run(args.voice_fixtures, os.path.splitext(args.output)[0] + "_frames")
+    with open(args.output, "w") as f:
+        json.dump(document, f, indent=2)
+    for name, reason in document["skipped"].items():
+        print(f"skipped {name}: {reason}")
+
+    if args.save_baseline or not os.path.exists(args.baseline):
+        for name, result in document["results"].items():
+            print(f"{name:24} {result['value']:10.3f} {result['unit']}")
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}, run with --save-baseline first")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(document, json.load(f), args.tolerance)
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
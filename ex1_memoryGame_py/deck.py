@@ -0,0 +1,213 @@
+import argparse
+import io
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+from collections import OrderedDict
+
+import pygame
+
+DECK_MAGIC = b"MEMDECK1"
+DECK_HEADER = struct.Struct("<8sI")  # magic, manifest length
+DECK_ALIGN = 64  # atlas and sound data start on aligned offsets
+TILE_SIZE = (80, 80)  # faces are stored at the largest size the board draws them (CARD_WIDTH x CARD_HEIGHT)
+MAX_OPEN_DECKS = 4  # mapped decks kept open for instant switching
+SOUNDS = ("match", "win")
+
+DEFAULT_FACES = [f"image{number}.png" for number in range(1, 9)]
+DEFAULT_BACK = "card_back.png"
+DEFAULT_SOUNDS = {"match": "positive_sound.wav", "win": "win_sound.wav"}
+
+# Deck file layout:
+#   DECK_HEADER | manifest (utf-8 json) | padding | atlas pixels | sound files
+# the manifest has the atlas size and pixel format, one [x, y, w, h] tile per face and for the back,
+# and (offset, length) of every sound. offsets are from the start of the file
+
+
+def align(offset):
+    """
+    :param offset:
+    :return: the next offset that is a multiple of DECK_ALIGN
+    """
+    return -(-offset // DECK_ALIGN) * DECK_ALIGN
+
+
+def build_deck(output, faces=DEFAULT_FACES, back=DEFAULT_BACK, sounds=DEFAULT_SOUNDS, tile_size=TILE_SIZE):
+    """
+    offline step: decode and scale every card image once and pack them into one atlas, together with
+    the sounds, in a single deck file
+    :param output: deck file path
+    :param faces: face image paths (the list index is the card id)
+    :param back: card back image path
+    :param sounds: sound name -> sound file path (wav, so loading it is a copy and not a decode)
+    :param tile_size: (width, height) every image is scaled to
+    :return: the manifest
+    """
+    images = [pygame.image.load(path) for path in list(faces) + [back]]
+    alpha = any(image.get_flags() & pygame.SRCALPHA for image in images)
+    pixel_format = "RGBA" if alpha else "RGB"
+
+    # square-ish grid of equal tiles, the back is the last tile
+    columns = math.ceil(math.sqrt(len(images)))
+    rows = math.ceil(len(images) / columns)
+    tile_width, tile_height = tile_size
+    atlas = pygame.Surface((columns * tile_width, rows * tile_height), pygame.SRCALPHA if alpha else 0, 32)
+    tiles = []
+    for number, image in enumerate(images):
+        row, col = divmod(number, columns)
+        rect = [col * tile_width, row * tile_height, tile_width, tile_height]
+        atlas.blit(pygame.transform.smoothscale(image.convert_alpha() if alpha else image.convert(),
+                                                tile_size), rect[:2])
+        tiles.append(rect)
+    pixels = pygame.image.tostring(atlas, pixel_format)
+
+    sound_data = {}
+    for name, path in sounds.items():
+        with open(path, "rb") as f:
+            sound_data[name] = f.read()
+
+    # the manifest holds the data offsets, so its length is settled before the offsets are filled in
+    manifest = {"version": 1,
+                "atlas": {"offset": 0, "size": list(atlas.get_size()), "format": pixel_format},
+                "faces": tiles[:-1],
+                "back": tiles[-1],
+                "sounds": {name: {"offset": 0, "length": len(data)} for name, data in sound_data.items()}}
+    while True:
+        encoded = json.dumps(manifest).encode()
+        offset = align(DECK_HEADER.size + len(encoded))
+        if manifest["atlas"]["offset"] == offset:
+            break
+        manifest["atlas"]["offset"] = offset
+        offset = align(offset + len(pixels))
+        for name, data in sound_data.items():
+            manifest["sounds"][name]["offset"] = offset
+            offset = align(offset + len(data))
+
+    # running games may have the old file mapped: truncating it under them could crash them (SIGBUS), so the
+    # new deck is written next to it and replaces it in one step, the mapped old file stays intact
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output)), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as f:
+            f.write(DECK_HEADER.pack(DECK_MAGIC, len(encoded)))
+            f.write(encoded)
+            for offset, data in [(manifest["atlas"]["offset"], pixels)] + \
+                                [(manifest["sounds"][name]["offset"], data) for name, data in sound_data.items()]:
+                f.write(bytes(offset - f.tell()))
+                f.write(data)
+        os.chmod(temporary, 0o644)  # mkstemp makes it private
+        os.replace(temporary, output)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    return manifest
+
+
+class Deck:
+    """
+    a deck file mapped into memory. the atlas surface is created directly on top of the mapped pixels
+    and the cards are subsurfaces of it, so opening a deck decodes nothing and only the pages that are
+    actually drawn are read from disk
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, length = DECK_HEADER.unpack_from(self.map)
+        if magic != DECK_MAGIC:
+            raise ValueError(f"{path} is not a deck file")
+        self.manifest = json.loads(self.map[DECK_HEADER.size:DECK_HEADER.size + length])
+
+        atlas = self.manifest["atlas"]
+        width, height = atlas["size"]
+        start = atlas["offset"]
+        end = start + width * height * len(atlas["format"])
+        self.atlas = pygame.image.frombuffer(memoryview(self.map)[start:end], (width, height), atlas["format"])
+        self.faces = [self.atlas.subsurface(rect) for rect in self.manifest["faces"]]
+        self.card_back = self.atlas.subsurface(self.manifest["back"])
+        self.sounds = {}  # name -> sound, loaded on first use
+
+    def sound(self, name):
+        """
+        :param name: one of SOUNDS
+        :return: the sound, or None if the deck has none or the mixer is not available
+        """
+        if name in self.sounds:
+            return self.sounds[name]
+        entry = self.manifest["sounds"].get(name)
+        if entry is None or not pygame.mixer.get_init():
+            return None
+        data = self.map[entry["offset"]:entry["offset"] + entry["length"]]
+        try:
+            sound = pygame.mixer.Sound(file=io.BytesIO(data))
+        except pygame.error:
+            print(f"Unable to load sound {name} from {self.path}")
+            sound = None
+        self.sounds[name] = sound
+        return sound
+
+
+class DeckLibrary:
+    """
+    least recently used set of open decks. switching back to a recent deck is a dictionary lookup, older
+    decks are dropped (their mapping is released once no card surface refers to it anymore)
+    """
+
+    def __init__(self, max_open=MAX_OPEN_DECKS):
+        self.max_open = max_open
+        self.decks = OrderedDict()
+
+    def open(self, path):
+        """
+        :param path: deck file path
+        :return: Deck
+        """
+        deck = self.decks.get(path)
+        if deck is not None:
+            self.decks.move_to_end(path)
+            return deck
+        deck = Deck(path)
+        self.decks[path] = deck
+        if len(self.decks) > self.max_open:
+            self.decks.popitem(last=False)
+        return deck
+
+
+def tile_size(text):
+    """
+    parse a tile size argument like "80x80"
+    :param text:
+    :return: (width, height)
+    """
+    try:
+        width, height = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected WIDTHxHEIGHT, e.g. 80x80")
+    return width, height
+
+
+def main():
+    parser = argparse.ArgumentParser(description="pack card images and sounds into a memory game deck file")
+    parser.add_argument("output", help="deck file to write, e.g. classic.deck")
+    parser.add_argument("--faces", nargs="+", default=DEFAULT_FACES, help="face images (default image1-8.png)")
+    parser.add_argument("--back", default=DEFAULT_BACK, help="card back image")
+    parser.add_argument("--match-sound", default=DEFAULT_SOUNDS["match"], help="sound played on a match")
+    parser.add_argument("--win-sound", default=DEFAULT_SOUNDS["win"], help="sound played on a win")
+    parser.add_argument("--tile-size", type=tile_size, default=TILE_SIZE, help="stored card size (default 80x80)")
+    args = parser.parse_args()
+
+    pygame.display.init()
+    pygame.display.set_mode((1, 1), pygame.HIDDEN)  # convert() needs a display
+    manifest = build_deck(args.output, args.faces, args.back,
+                          {"match": args.match_sound, "win": args.win_sound}, args.tile_size)
+    width, height = manifest["atlas"]["size"]
+    print(f"{args.output}: {len(manifest['faces'])} faces in a {width}x{height} "
+          f"{manifest['atlas']['format']} atlas, {len(manifest['sounds'])} sounds")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
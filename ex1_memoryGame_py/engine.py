@@ -0,0 +1,143 @@
+import argparse
+import random
+from array import array
+
+ROWS, COLS = 4, 4  # cards arrangement
+MAX_BOARD_SIDE = 64  # cards per row or column at most, the game's cards are still 4 pixels wide there
+
+MAX_HINTS = 3  # Maximum number of hints per game
+INITIAL_TIME_LIMIT = 60  # Initial time limit for Time Attack mode in seconds
+TIME_LIMIT_DECREMENT = 10  # Time limit decrement for each subsequent game in Time Attack mode
+
+
+def board_size(text):
+    """
+    parse a board size argument like "8x8"
+    :param text:
+    :return: (rows, cols)
+    """
+    try:
+        rows, cols = (int(part) for part in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected ROWSxCOLS, e.g. 8x8")
+    if rows < 1 or cols < 1:
+        raise argparse.ArgumentTypeError("the board needs at least 1 row and 1 column")
+    if max(rows, cols) > MAX_BOARD_SIDE:
+        raise argparse.ArgumentTypeError(f"at most {MAX_BOARD_SIDE} cards per row or column fit on the screen")
+    if rows * cols % 2:
+        raise argparse.ArgumentTypeError("the board needs an even number of cards")
+    return rows, cols
+
+
+class GameState:
+    """
+    the rules of the memory game without any drawing or pygame. every card is an integer id (the two
+    cards of a pair share it), revealed / matched flags live in byte arrays so every check is O(1).
+    the unmatched cards are also kept in an indexed list (swap-remove on a match), so picking a hint
+    doesn't scan the board, which matters on large grids
+    """
+
+    __slots__ = ("rows", "cols", "size", "num_players", "max_hints", "seed", "rng", "cards", "revealed",
+                 "matched", "matched_count", "unmatched", "unmatched_position", "selected", "hints_remaining",
+                 "player_turn", "moves")
+
+    def __init__(self, rows=ROWS, cols=COLS, num_players=1, max_hints=MAX_HINTS, seed=None):
+        if rows * cols % 2:
+            raise ValueError("the board needs an even number of cards")
+        if rows * cols // 2 > 0xFFFF:
+            raise ValueError("too many cards")
+        self.rows = rows
+        self.cols = cols
+        self.size = rows * cols
+        self.num_players = num_players
+        self.max_hints = max_hints
+        self.reset(seed)
+
+    def reset(self, seed=None):
+        """
+        shuffle a new board
+        :param seed: shuffle seed, a random one is picked (and kept in self.seed) if not given
+        :return:
+        """
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        cards = list(range(self.size // 2)) * 2
+        self.rng.shuffle(cards)
+        self.cards = array("H", cards)
+        self.revealed = bytearray(self.size)
+        self.matched = bytearray(self.size)
+        self.matched_count = 0
+        self.unmatched = array("I", range(self.size))  # unmatched card indices, in no particular order
+        self.unmatched_position = array("I", range(self.size))  # card index -> its slot in self.unmatched
+        self.selected = []
+        self.hints_remaining = self.max_hints
+        self.player_turn = 1  # Player 1 starts
+        self.moves = 0  # pairs turned over
+
+    def select(self, index):
+        """
+        turn a card face up
+        :param index: card index on the board
+        :return: True if the card was turned, False if it can't be picked right now
+        """
+        if not 0 <= index < self.size or self.revealed[index] or self.matched[index] or len(self.selected) == 2:
+            return False
+        self.revealed[index] = 1
+        self.selected.append(index)
+        return True
+
+    def check_match(self):
+        """
+        resolve the two selected cards: a pair stays matched, otherwise both are turned back and in
+        2 player mode the turn passes
+        :return: True for a match, False for a mismatch, None if two cards are not selected
+        """
+        if len(self.selected) != 2:
+            return None
+        first, second = self.selected
+        self.selected = []
+        self.moves += 1
+        if self.cards[first] == self.cards[second]:
+            self.matched[first] = self.matched[second] = 1
+            self.matched_count += 2
+            self.remove_unmatched(first)
+            self.remove_unmatched(second)
+            return True
+        # Hide the cards if they don't match
+        self.revealed[first] = self.revealed[second] = 0
+        if self.num_players == 2:
+            self.player_turn = 1 if self.player_turn == 2 else 2
+        return False
+
+    def remove_unmatched(self, index):
+        """
+        O(1) removal from the unmatched list: the last entry takes the removed card's slot
+        :param index:
+        :return:
+        """
+        slot = self.unmatched_position[index]
+        last = self.unmatched.pop()
+        if last != index:
+            self.unmatched[slot] = last
+            self.unmatched_position[last] = slot
+
+    def hint(self, exclude=()):
+        """
+        spend a hint (1 player mode only) on a random card that is neither revealed nor matched
+        :param exclude: card indices that may not be picked either (e.g. cards still turning back)
+        :return: index of the card to show, or None
+        """
+        if self.num_players != 1 or self.hints_remaining <= 0:
+            return None
+        # only the (at most 2) selected cards and the few excluded ones can't be picked, so a few draws are enough
+        excluded = sum(1 for index in exclude if not self.revealed[index] and not self.matched[index])
+        if len(self.unmatched) <= len(self.selected) + excluded:
+            return None
+        index = self.rng.choice(self.unmatched)
+        while self.revealed[index] or index in exclude:
+            index = self.rng.choice(self.unmatched)
+        self.hints_remaining -= 1
+        return index
+
+    def is_won(self):
+        return self.matched_count == self.size
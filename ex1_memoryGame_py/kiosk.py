@@ -0,0 +1,274 @@
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from deck import DEFAULT_FACES, DEFAULT_BACK, DEFAULT_SOUNDS
+
+KIOSK_DECK = "kiosk.deck"  # shared deck built from the default images and sounds
+INSTANCES = 4
+INTERVAL = 5  # seconds between reports
+STOP_TIMEOUT = 5  # seconds an instance gets to shut down before it is killed
+DRIVERS = ("dummy", "offscreen", "window")
+
+
+def shared_deck(path=KIOSK_DECK):
+    """
+    build the deck every instance maps, unless it is newer than the images and sounds it is made of
+    :param path:
+    :return: path
+    """
+    sources = DEFAULT_FACES + [DEFAULT_BACK] + list(DEFAULT_SOUNDS.values())
+    if not os.path.exists(path) or os.path.getmtime(path) < max(os.path.getmtime(source) for source in sources):
+        subprocess.run([sys.executable, "deck.py", path], check=True)
+    return path
+
+
+def process_memory(pid):
+    """
+    :param pid:
+    :return: (rss, pss) in MB. pss splits shared pages (the mapped deck, libraries) between the processes
+        using them, so it adds up to the real total. pss is None where the kernel doesn't report it
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f if line.endswith("kB\n"))
+        return int(fields["Rss"].split()[0]) / 1024, int(fields["Pss"].split()[0]) / 1024
+    except (OSError, KeyError):
+        pass
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, None
+
+
+def run_game(args, env, output):
+    """
+    game process forked from the kiosk. pygame and the game modules were imported by the kiosk before
+    forking, so their memory is shared with it (and every other game) until written to
+    :param args: memorygame.py arguments
+    :param env: environment variables to set
+    :param output: pipe the game's output goes to
+    :return:
+    """
+    os.dup2(output, 1)
+    os.dup2(output, 2)
+    os.close(output)
+    os.environ.update(env)  # SDL reads the drivers when the game initializes it
+    sys.argv = ["memorygame.py"] + args
+    import memorygame  # already loaded
+
+    memorygame.main()
+
+
+class Instance:
+    """
+    one game process of the kiosk, restarted when it exits. it is forked from the kiosk (sharing the
+    loaded modules) or started as a new python process. its frame rate comes from the "fps" lines it
+    prints (memorygame.py --stats-interval)
+    """
+
+    def __init__(self, number, args, env, fork):
+        self.number = number
+        self.args = args
+        self.env = env
+        self.fork = fork
+        self.process = None
+        self.fps = 0.0
+        self.fps_time = 0  # when the last fps line came
+        self.restarts = -1
+        self.start()
+
+    def start(self):
+        if self.fork:
+            read, write = os.pipe()
+            self.process = multiprocessing.get_context("fork").Process(target=run_game,
+                                                                       args=(self.args, self.env, write))
+            self.process.start()
+            os.close(write)
+            output = os.fdopen(read)
+        else:
+            self.process = subprocess.Popen([sys.executable, "memorygame.py"] + self.args, stdout=subprocess.PIPE,
+                                            stderr=subprocess.STDOUT, text=True, env=dict(os.environ, **self.env))
+            output = self.process.stdout
+        self.restarts += 1
+        self.fps_time = 0
+        threading.Thread(target=self.read_output, args=(output,), name=f"instance-{self.number}",
+                         daemon=True).start()
+
+    def running(self):
+        return self.process.is_alive() if self.fork else self.process.poll() is None
+
+    def read_output(self, output):
+        for line in output:
+            if line.startswith("fps "):
+                self.fps = float(line.split()[1])
+                self.fps_time = time.monotonic()
+
+    def current_fps(self, interval):
+        """
+        :param interval: stats interval of the instance
+        :return: its last frame rate, 0 if it didn't report lately (e.g. in the menu, where nothing is drawn)
+        """
+        return self.fps if time.monotonic() - self.fps_time < 2 * interval else 0.0
+
+    def stop(self):
+        if not self.running():
+            return
+        os.kill(self.process.pid, signal.SIGTERM)  # SDL turns it into a quit event, the game closes normally
+        if self.fork:
+            self.process.join(STOP_TIMEOUT)
+            if self.process.is_alive():
+                self.process.kill()
+                self.process.join()
+            return
+        try:
+            self.process.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+def drain(output):
+    """
+    read a process's output until it exits, dropping it
+    :param output:
+    :return:
+    """
+    for _ in output:
+        pass
+
+
+def start_voice_service():
+    """
+    :return: (service process, "host:port")
+    """
+    service = subprocess.Popen([sys.executable, "voice_service.py", "--port", "0"], stdout=subprocess.PIPE, text=True)
+    for line in service.stdout:
+        if line.startswith("serving on"):
+            # keep reading what it prints (a line per connection), a full pipe would block its event loop
+            threading.Thread(target=drain, args=(service.stdout,), name="voice-service-output", daemon=True).start()
+            return service, line.split()[-1]
+    raise RuntimeError("the voice service did not start")
+
+
+def run(instances=INSTANCES, driver="dummy", board=None, replay=None, voice=False, share_deck=True,
+        fork=hasattr(os, "fork"), seconds=None, interval=INTERVAL):
+    """
+    run game instances side by side and report their frame rate and memory
+    :param instances: number of games
+    :param driver: SDL video driver of the games, "window" for normal windows
+    :param board: board size argument, e.g. "4x4"
+    :param replay: session log every instance plays over and over (attract mode / load), None to wait for players
+    :param voice: start one recognizer service for all of them
+    :param share_deck: every game maps the same deck file, instead of decoding the images itself
+    :param fork: fork the games from this process with the game modules loaded, instead of starting new pythons
+    :param seconds: how long to run, None until Ctrl+C
+    :param interval: seconds between reports
+    :return: summary dict
+    """
+    args = ["--stats-interval", str(interval)]
+    if share_deck:
+        args += ["--deck", shared_deck()]
+    if board:
+        args += ["--board", board]
+    if replay:
+        args += ["--replay", replay]
+    env = {"PYGAME_HIDE_SUPPORT_PROMPT": "1"}
+    if driver != "window":
+        env.update(SDL_VIDEODRIVER=driver, SDL_AUDIODRIVER="dummy")
+
+    service, service_memory = None, None
+    if voice:
+        service, service_address = start_voice_service()
+        args += ["--voice-service", service_address]
+    if fork:
+        os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+        import memorygame  # noqa: F401  loaded once here, shared by every forked game
+
+        gc.freeze()  # keep the collector from touching (and so copying) the shared objects in every game
+    games = [Instance(number, args + ["--player", f"kiosk{number}"], env, fork) for number in range(instances)]
+
+    samples = []
+    start = time.monotonic()
+    try:
+        while seconds is None or time.monotonic() - start < seconds:
+            time.sleep(interval if seconds is None else min(interval, max(0, seconds - (time.monotonic() - start))))
+            running = [game for game in games if game.running()]
+            memory = [process_memory(game.process.pid) for game in running]
+            fps = [game.current_fps(interval) for game in running]
+            if fork:
+                memory.append(process_memory(os.getpid()))  # the shared modules are partly counted here
+            for game in games:
+                if game not in running:
+                    game.start()
+            if service is not None:
+                service_memory = process_memory(service.pid)
+            sample = {
+                "fps": sum(fps),
+                "rss_mb": sum(rss for rss, _ in memory),
+                "pss_mb": sum(pss for _, pss in memory) if None not in (pss for _, pss in memory) else None,
+            }
+            samples.append(sample)
+            pss = "" if sample["pss_mb"] is None else f", pss {sample['pss_mb']:.0f} MB"
+            voice_text = "" if service_memory is None else f", voice service rss {service_memory[0]:.0f} MB"
+            print(f"{len(running)} games: {sample['fps']:.0f} fps, rss {sample['rss_mb']:.0f} MB{pss}{voice_text}",
+                  flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for game in games:
+            game.stop()
+        if service is not None:
+            service.send_signal(signal.SIGINT)
+            service.wait()
+
+    last = samples[-1] if samples else {"fps": 0, "rss_mb": 0, "pss_mb": None}
+    return {
+        "instances": instances,
+        "driver": driver,
+        "shared_deck": share_deck,
+        "fork": fork,
+        "seconds": time.monotonic() - start,
+        "fps_total": last["fps"],
+        "fps_mean_total": sum(sample["fps"] for sample in samples) / len(samples) if samples else 0,
+        "rss_mb_total": last["rss_mb"],
+        "pss_mb_total": last["pss_mb"],
+        "pss_mb_per_game": last["pss_mb"] / instances if last["pss_mb"] is not None else None,
+        "voice_service_rss_mb": service_memory[0] if service_memory else None,
+        "restarts": sum(game.restarts for game in games),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="run several memory games on one host (run from the game directory)")
+    parser.add_argument("--instances", type=int, default=INSTANCES)
+    parser.add_argument("--driver", choices=DRIVERS, default="dummy",
+                        help="SDL video driver, dummy / offscreen for headless hosts, window for real windows")
+    parser.add_argument("--board", help="board size, e.g. 8x8")
+    parser.add_argument("--replay", metavar="LOG", help="every game plays this recorded session, over and over")
+    parser.add_argument("--voice", action="store_true",
+                        help="start one voice recognizer service the games share instead of each loading the model")
+    parser.add_argument("--no-shared-deck", action="store_true",
+                        help="let every game decode the images itself (to compare memory)")
+    parser.add_argument("--no-fork", action="store_true",
+                        help="start every game as a new python process instead of forking it from the kiosk")
+    parser.add_argument("--seconds", type=float, help="stop after this long (default: until Ctrl+C)")
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds between reports")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    summary = run(args.instances, args.driver, args.board, args.replay, args.voice, not args.no_shared_deck,
+                  not args.no_fork and hasattr(os, "fork"), args.seconds, args.interval)
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
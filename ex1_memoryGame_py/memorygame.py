@@ -1,10 +1,25 @@
+import time
+
+START_TIME = time.perf_counter()  # fallback for startup measurements where /proc is not available
+
 import pygame
+import argparse
+import colorsys
+import os
 import random
-import time
 import sys
-from vosk import Model, KaldiRecognizer
-import pyaudio
-import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from animation import Scheduler
+import audio
+from deck import DeckLibrary
+from engine import GameState, ROWS, COLS, MAX_BOARD_SIDE, INITIAL_TIME_LIMIT, TIME_LIMIT_DECREMENT, board_size
+from profiler import FrameProfiler, NullProfiler
+from render_cache import SurfaceCache, TextCache, MAX_CACHED_SURFACES
+from replay import Recorder, Replay, state_checksum
+from results import ResultStore, RESULTS_DB, MODES, WON, LOST, ABANDONED
+from voice import VoiceEngine, VOICE_MODEL  # vosk and pyaudio are only imported when a voice game starts
 
 # Define colors
 WHITE = (255, 255, 255)
@@ -18,47 +33,71 @@ BLACK = (0, 0, 0)
 # Constants
 WIDTH, HEIGHT = 400, 450  # game screen size
 
-CARD_WIDTH, CARD_HEIGHT = 80, 80  # Define card properties
+CARD_WIDTH, CARD_HEIGHT = 80, 80  # Define card properties (on a 4x4 board, larger boards get smaller cards)
 GAP = 10  # between cards
-ROWS, COLS = 4, 4  # cards arrangement
+BOARD_SIZE = 4 * (CARD_WIDTH + GAP)  # square area the cards are laid out in
+FLIP_FRAMES = 8  # card widths drawn per half of a flip animation
+CARD_IMAGES = 8  # image1.png ... image8.png, larger boards get generated faces for the extra pairs
+FLIP_TIME = 0.2  # seconds for each half of a card flip
+MATCH_CHECK_DELAY = 1  # seconds both selected cards stay visible before checking for a match
+HINT_TIME = 1  # seconds a hint card stays revealed
+FPS = 60  # frame rate while something is moving
+PROFILE_OUTPUT = "frame_profile"  # frame_profile.json / .csv are written at exit when profiling was on
+OVERLAY_INTERVAL = 0.5  # seconds between profiler overlay updates
 
-MAX_HINTS = 3  # Maximum number of hints per game
-INITIAL_TIME_LIMIT = 60  # Initial time limit for Time Attack mode in seconds
-TIME_LIMIT_DECREMENT = 10  # Time limit decrement for each subsequent game in Time Attack mode
+VOICE_LOW_LATENCY = True  # constrained grammar + partial results instead of open vocabulary decoding
+VOICE_EVENT = pygame.USEREVENT + 1  # posted by the voice thread with the spoken command and card index
+NET_EVENT = pygame.USEREVENT + 2  # posted by the network thread with a server message and its fields
 
-VOICE_MODEL = "vosk-model-small-en-us-0.15"
+DEFAULT_PLAYER = "player"  # name results are saved under when no --player is given
+MODE_TITLES = {"1_player": "1 Player", "2_players": "2 Players", "time_attack": "Time Attack",
+               "voice": "Voice Control", "online": "Online"}
 
 
 class MemoryGame:
-    def __init__(self):
-        # Initialize Pygame
+    def __init__(self, rows=ROWS, cols=COLS, decks=(), profile=False, seed=None):
+        # Initialize Pygame, with a small mixer buffer so feedback sounds come out right away
+        audio.configure()
         pygame.init()
+        self.audio = audio.open_audio()  # does nothing when there is no sound device
+
+        # Board layout, the cards shrink to fit larger boards into the same area
+        self.rows, self.cols = rows, cols
+        pitch = BOARD_SIZE // max(rows, cols)
+        self.gap = max(1, pitch * GAP // (CARD_WIDTH + GAP))
+        self.card_width = self.card_height = pitch - self.gap
+        # every width the flip animation draws
+        self.flip_widths = [round(self.card_width * frame / FLIP_FRAMES) for frame in range(FLIP_FRAMES + 1)]
 
         # Set up display
         self.WINDOW = pygame.display.set_mode((WIDTH, HEIGHT))
         pygame.display.set_caption("Memory Game")
-
-        # Load images
-        self.images, self.card_back = self.load_card_images()
-        # Duplicate images to create pairs
-        self.images *= 2
-        # Shuffle images
-        random.shuffle(self.images)
-
-        # Define font
-        self.FONT = pygame.font.SysFont("", 40)
-
-        # Define game variables
-        self.revealed = [False] * (ROWS * COLS)
-        self.selected = []
-        self.matched = []
-        self.hints_remaining = MAX_HINTS
-        self.hint_index = None
-
-        # Load positive sound
-        self.match_sound = self.load_sound("positive_sound.wav")
-        # Load win sound
-        self.win_sound = self.load_sound("win_sound.wav")
+        pygame.event.set_blocked(pygame.MOUSEMOTION)  # unused, and it would wake the idle loops
+
+        # Deck files (see deck.py) replace the image and sound files, "D" switches to the next one
+        self.deck_paths = list(decks)
+        self.deck_index = 0
+        self.decks = DeckLibrary()
+
+        # Images and sounds are decoded in the background while the menu is already usable,
+        # prepare_assets() picks them up when a game starts
+        self.loader = ThreadPoolExecutor(max_workers=1)
+        self.assets = self.loader.submit(self.load_assets, rows * cols // 2)
+        self.images = None  # card id -> face
+        self.card_back = None
+        self.surface_cache = None
+
+        # Define font (SysFont("") ends up with the default font too, but scans the system fonts first)
+        self.FONT = pygame.font.Font(None, 40)
+        self.small_font = pygame.font.Font(None, 25)  # voice control help
+        self.text_cache = TextCache()  # every label is rendered once per (text, font, color)
+
+        # Define game variables, the rules live in the (pygame free) game state. every game's shuffle
+        # comes from the session seed, so a recorded session can be played again
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.seeds = random.Random(self.seed)
+        self.state = GameState(rows, cols, seed=self.seeds.randrange(2 ** 32))
+        self.hint_index = None  # card shown by the current hint
 
         self.num_players = 0
         self.time_attack = False
@@ -68,15 +107,49 @@ class MemoryGame:
         self.running = True
         self.game_over = False
         self.clock = pygame.time.Clock()
+        # Frame profiler, F3 turns it on (if needed) and toggles its overlay. when off every call is a no-op
+        self.profiler = FrameProfiler(FPS) if profile else NullProfiler()
+        self.profile_output = PROFILE_OUTPUT
+        self.show_overlay = False
+        self.overlay_lines = None  # text shown by the overlay
+        self.overlay_rect = None
+        self.overlay_font = None
+        self.overlay_time = 0  # when the overlay text was last updated
+
+        self.animations = Scheduler()  # flips and delays, advanced by the main loop every frame
+        self.flips = {}  # card index -> (width, showing face) for cards in the middle of an animation
+
+        # Game time: sampled once per frame, in seconds since the session started (from the log when replaying)
+        self.clock_start = time.time()
+        self.frame_time = 0
+        self.recorder = None  # Recorder writing the input of this session
+        self.net = None  # NetClient of a networked 2 player game, the server owns the board
+        self.net_turn = None  # whose turn it is after the last pair, according to the server
+        self.net_pairs = None  # (P1, P2) pairs at the end of a networked game
+        self.net_status = None  # shown instead of whose turn it is (waiting, left, ...)
+        self.net_queue = deque()  # server messages not applied yet, in order (a card waits for the last pair)
+        self.net_selections = {}  # sequence number -> card index of selections the server didn't answer yet
+        self.replay = None  # Replay feeding a recorded session instead of live input
+        self.results = None  # ResultStore every finished (or abandoned) game is saved to
+        self.player = DEFAULT_PLAYER
 
         self.start_time = None  # Start time
         self.elapsed_time = None
-        self.voice_index = None
+        self.voice_engine = None  # created on first use and kept for the whole session
+        self.voice_service = None  # (host, port) of a shared recognizer service (voice_service.py) to use instead
+        self.stats_interval = None  # seconds between "fps" lines on stdout (read by kiosk.py), None for none
+        self.stats_time = 0  # frame time of the last line
+        self.stats_frames = 0  # frames since then
         self.menu_rect = None
         self.reset_text_rect = None
         self.hint_rect = None
 
-        self.player_turn = 1  # Player 1 starts
+        # Retained rendering: only what changed since the last frame is redrawn and sent to the screen
+        self.full_redraw = True  # repaint the whole window on the next frame
+        self.dirty_rects = []  # window areas changed this frame
+        self.card_views = [None] * (rows * cols)  # what each card showed on the last frame
+        self.changed_cards = set()  # cards that may look different since the last frame
+        self.widgets = {}  # HUD widget name -> (content shown, rect)
 
         # Display window for game modes
         one_player_button_rect = pygame.Rect(100, 150, 200, 50)
@@ -85,63 +158,114 @@ class MemoryGame:
         voice_control_button_rect = pygame.Rect(100, 20, 200, 50)
         self.rect_list = [one_player_button_rect, two_players_button_rect, time_attack_button_rect, voice_control_button_rect]
 
+    def speech_recognition(self):
+        """
+        voice control using VOSK. recognition runs on the voice engine thread and every recognized
+        command is posted to the event queue as a VOICE_EVENT
+        :return:
+        """
+        if self.voice_engine is None and self.voice_service is not None:
+            from voice_service import RemoteVoiceEngine
+
+            self.voice_engine = RemoteVoiceEngine(self.voice_service, low_latency=VOICE_LOW_LATENCY)
+        elif self.voice_engine is None:
+            self.voice_engine = VoiceEngine(VOICE_MODEL, low_latency=VOICE_LOW_LATENCY)
+        self.voice_engine.start(self.post_voice_command)
+        print("speak")
+
     @staticmethod
-    def text_to_index(text):
+    def post_voice_command(command, index):
         """
-        convert text audio to card index in the game
-        :param text: audio text
+        voice engine callback (runs on the voice thread). hands the command over to the game loop
+        :param command: "card", "reset", "hint" or "menu"
+        :param index: card index for "card" commands
         :return:
         """
-        num_dict = {
-            "one": 0, "two": 2, "three": 3, "four": 4, "five": 5,
-            "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
-            "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
-            "sixteen": 16
-        }
+        pygame.event.post(pygame.event.Event(VOICE_EVENT, command=command, index=index))
 
-        parts = text.split()
-        if len(parts) > 1 and parts[0] == "number":
-            return num_dict.get(parts[1].lower(), "Number not recognized")
-        return "Format not recognized"
+    def load_assets(self, pairs):
+        """
+        decode card images and sounds, or map the current deck file (runs on the loader thread)
+        :param pairs: number of different faces needed
+        :return: (faces, card back, match sound, win sound)
+        """
+        if self.deck_paths:
+            return self.load_deck(self.deck_paths[self.deck_index], pairs)
+        images, card_back = MemoryGame.load_card_images(pairs)
+        # Load positive sound
+        match_sound = MemoryGame.load_sound("positive_sound.wav")
+        # Load win sound
+        win_sound = MemoryGame.load_sound("win_sound.wav")
+        return images, card_back, match_sound, win_sound
 
-    def speech_recognition(self):
+    def prepare_assets(self):
         """
-        voice control using VOSK
-        :return: card index of what the user said
+        wait for the loader thread (usually long done by the time a mode is picked) and use its assets
+        :return:
         """
-        model = Model(VOICE_MODEL)
-        recognizer = KaldiRecognizer(model, 16000)
-        recognizer.SetWords(True)
+        if self.images is not None:
+            return
+        self.use_assets(*self.assets.result())
+        self.loader.shutdown()
 
-        mic = pyaudio.PyAudio()
-        stream = mic.open(format=pyaudio.paInt16, channels=1, rate=16000, input=True, frames_per_buffer=8192)
-        stream.start_stream()
+    def use_assets(self, images, card_back, match_sound, win_sound):
+        """
+        switch to a set of faces, back and sounds: add generated faces and scale every card once, with its
+        flip animation frames too if they fit in the cache
+        :param images: faces, there may be fewer than pairs
+        :param card_back:
+        :param match_sound:
+        :param win_sound:
+        :return:
+        """
+        self.card_back = card_back
+        self.audio.load("match", match_sound)
+        self.audio.load("win", win_sound)
+        pairs = self.rows * self.cols // 2
+        self.images = images + [self.make_card_face(card_id, self.FONT) for card_id in range(len(images), pairs)]
+
+        if self.surface_cache is None:
+            self.surface_cache = SurfaceCache(max(MAX_CACHED_SURFACES, 2 * len(self.images) + 64))
+        else:
+            self.surface_cache.clear()  # the old deck's cards
+        cards = self.images + [self.card_back]
+        if len(cards) * len(self.flip_widths) <= self.surface_cache.max_entries:
+            self.surface_cache.preload(cards, self.flip_widths, self.card_height)
+        else:
+            self.surface_cache.preload(cards, [self.card_width], self.card_height)
 
-        print("speak")
-        while True:
-            data = stream.read(4096)
-            if len(data) == 0:
-                break
-            if recognizer.AcceptWaveform(data):
-                text = recognizer.Result()
-                index = json.loads(text)
-                print(index["text"])
-                index = self.text_to_index(index["text"])
-
-                if isinstance(index, int):
-                    return index - 1
-
-        stream.stop_stream()
-        stream.close()
-        mic.terminate()
+    def load_deck(self, path, pairs):
+        """
+        open a deck file. the cards are views into the mapped file, nothing is decoded
+        :param path: deck file path
+        :param pairs: number of different faces needed
+        :return: (faces, card back, match sound, win sound)
+        """
+        deck = self.decks.open(path)
+        return deck.faces[:pairs], deck.card_back, deck.sound("match"), deck.sound("win")
+
+    def switch_deck(self):
+        """
+        move on to the next deck given on the command line, also in the middle of a game
+        :return:
+        """
+        if len(self.deck_paths) < 2:
+            return
+        self.prepare_assets()
+        self.deck_index = (self.deck_index + 1) % len(self.deck_paths)
+        self.use_assets(*self.load_deck(self.deck_paths[self.deck_index], self.rows * self.cols // 2))
+        self.invalidate()
+        print(f"deck: {self.deck_paths[self.deck_index]}")
 
     @staticmethod
     def load_sound(file_path):
         """
         load game sounds
         :param file_path:
-        :return: sound
+        :return: sound, None if it can't be played
         """
+        if not pygame.mixer.get_init():
+            return None  # no sound device, the game plays silently
         try:
             sound = pygame.mixer.Sound(file_path)
             return sound
@@ -149,76 +273,198 @@ class MemoryGame:
             print(f"Unable to load sound file: {file_path}")
             return None
 
-    def draw_board(self, flip_animation=None):
+    def draw_board(self):
         """
-        board drawing and updates for the game play
-        :param flip_animation:
+        board drawing and updates for the game play. only cards marked as changed (or all of them on a
+        full redraw) are looked at, and only those that look different from the last frame are redrawn,
+        their rects are added to the dirty rects
         :return:
         """
-        self.WINDOW.fill(WHITE)
+        if self.full_redraw:
+            self.WINDOW.fill(WHITE)
+            self.card_views = [None] * (self.rows * self.cols)
+            self.widgets = {}
+            indices = range(self.rows * self.cols)
+        else:
+            indices = self.changed_cards
         if self.card_back is None:
             self.card_back = pygame.image.load("card_back.png")
-        for i in range(ROWS):
-            for j in range(COLS):
-                index = i * COLS + j
-                x = j * (CARD_WIDTH + GAP)
-                y = i * (CARD_HEIGHT + GAP)
-
-                if (i, j) in self.matched:
-                    pygame.draw.rect(self.WINDOW, WHITE, (x, y, CARD_WIDTH, CARD_HEIGHT))
-                else:
-                    if self.revealed[index] or (flip_animation and flip_animation["index"] == index):
-                        if flip_animation and flip_animation["index"] == index:
-                            width = flip_animation["width"]
-                            x += (CARD_WIDTH - width) / 2  # Center the animating card
-                            if flip_animation["phase"] == "hiding":
-                                # Show card back shrinking
-                                img = pygame.transform.scale(self.card_back, (width, CARD_HEIGHT))
-                            else:
-                                # Show card face expanding
-                                img = pygame.transform.scale(self.images[index], (width, CARD_HEIGHT))
-                        else:
-                            width = CARD_WIDTH
-                            img = pygame.transform.scale(self.images[index], (width, CARD_HEIGHT))
-                        self.WINDOW.blit(img, (x, y))
-                    else:
-                        # Display card back
-                        card_back_scaled = pygame.transform.scale(self.card_back, (CARD_WIDTH, CARD_HEIGHT))
-                        self.WINDOW.blit(card_back_scaled, (x, y))
+        for index in indices:
+            if self.state.matched[index]:
+                img = None
+                width = self.card_width
+            elif index in self.flips:
+                # Card in the middle of a flip: one side shrinking or the other expanding
+                width, face = self.flips[index]
+                img = self.images[self.state.cards[index]] if face else self.card_back
+            elif self.state.revealed[index]:
+                width = self.card_width
+                img = self.images[self.state.cards[index]]
+            else:
+                # Display card back
+                width = self.card_width
+                img = self.card_back
+
+            if self.card_views[index] == (img, width):
+                continue  # unchanged since the last frame
+            self.card_views[index] = (img, width)
+
+            row, col = divmod(index, self.cols)
+            x = col * (self.card_width + self.gap)
+            y = row * (self.card_height + self.gap)
+            card_rect = pygame.Rect(x, y, self.card_width, self.card_height)
+            pygame.draw.rect(self.WINDOW, WHITE, card_rect)
+            if img is not None:
+                x += (self.card_width - width) / 2  # Center the animating card
+                self.WINDOW.blit(self.surface_cache.get(img, (width, self.card_height)), (x, y))
+            self.dirty_rects.append(card_rect)
+        self.changed_cards = set()
+
+    def card_at(self, x, y):
+        """
+        hit-testing for the board
+        :param x:
+        :param y:
+        :return: (row, col) of the card under the point, or None outside the grid
+        """
+        col = x // (self.card_width + self.gap)
+        row = y // (self.card_height + self.gap)
+        if col < self.cols and row < self.rows:
+            return row, col
+        return None
 
-    def flip_animation_step(self, index, hint=False):
+    def draw_widget(self, name, content, render):
         """
-        flipping card animation for when a card is to be revealed to the player
-        :param index:
-        :param hint:
+        redraw a HUD widget only when what it shows changed
+        :param name: widget name
+        :param content: everything the widget shows, compared with the last frame
+        :param render: function drawing the widget, returns its rect
+        :return: the widget rect
+        """
+        old_content, old_rect = self.widgets.get(name, (None, None))
+        if old_rect is not None and old_content == content:
+            return old_rect
+        if old_rect is not None:  # erase the old widget, the new one may be smaller
+            pygame.draw.rect(self.WINDOW, WHITE, old_rect)
+            self.dirty_rects.append(old_rect)
+        rect = render()
+        self.widgets[name] = (content, rect)
+        self.dirty_rects.append(rect)
+        return rect
+
+    def invalidate(self):
+        """
+        repaint the whole window on the next frame (new game, back from the menu, window exposed)
         :return:
         """
-        width = None
-        # First phase: shrinking the card to the middle
-        for width in range(CARD_WIDTH, 0, -10):
-            self.draw_board(flip_animation={"index": index, "width": width, "phase": "hiding"})
-            pygame.display.update()
-            pygame.time.wait(25)
+        self.full_redraw = True
 
-        # Swap from the card back to the card face here if necessary
-        if not self.revealed[index]:
-            self.revealed[index] = True  # This ensures that the card face is shown in the expanding phase
-
-        # Second phase: expanding the card from the middle to full width
-        for width in range(0, CARD_WIDTH + 1, 10):
-            self.draw_board(flip_animation={"index": index, "width": width, "phase": "revealing"})
+    def update_display(self):
+        """
+        send the parts of the window that changed to the screen
+        :return:
+        """
+        if self.full_redraw:
             pygame.display.update()
-            pygame.time.wait(25)
+            self.full_redraw = False
+        elif self.dirty_rects:
+            pygame.display.update(self.dirty_rects)
+        self.dirty_rects = []
 
-        # close card shortly after revealed if hint
-        if hint:
-            self.revealed[index] = False
-            self.draw_board(flip_animation={"index": index, "width": width, "phase": "revealing"})
-            pygame.display.update()
-            pygame.time.wait(25)
+    def toggle_overlay(self):
+        """
+        show or hide the profiler overlay, profiling starts the first time it is shown
+        :return:
+        """
+        if not self.profiler.enabled:
+            self.profiler = FrameProfiler(FPS)
+        self.show_overlay = not self.show_overlay
+        self.overlay_lines = None
+        if self.overlay_font is None:
+            self.overlay_font = pygame.font.Font(None, 20)
+        if not self.show_overlay:
+            self.invalidate()  # bring back the cards under it
+
+    def draw_overlay(self):
+        """
+        draw the profiler statistics over the top left of the board. the text changes every OVERLAY_INTERVAL,
+        in between the panel is only redrawn when something was drawn under it
+        :return:
+        """
+        now = time.perf_counter()
+        if self.overlay_lines is None or now - self.overlay_time >= OVERLAY_INTERVAL:
+            lines = self.profiler.overlay_lines()
+            self.overlay_time = now
+        else:
+            lines = self.overlay_lines
+        if lines == self.overlay_lines and self.overlay_rect.collidelist(self.dirty_rects) == -1:
+            return
+        self.overlay_lines = lines
+
+        font = self.overlay_font
+        line_height = font.get_linesize()
+        self.overlay_rect = pygame.Rect(0, 0, 200, line_height * len(lines) + 8)
+        pygame.draw.rect(self.WINDOW, BLACK, self.overlay_rect)
+        for number, line in enumerate(lines):
+            self.WINDOW.blit(self.text_cache.get(line, font, WHITE), (6, 4 + number * line_height))
+        self.dirty_rects.append(self.overlay_rect)
+
+    def close(self):
+        """
+        release the voice engine, finish the session log and write the frame profile before quitting
+        :return:
+        """
+        if self.voice_engine is not None:
+            self.voice_engine.close()
+        if not self.game_over and self.state.moves:
+            self.record_result(ABANDONED)
+        if self.results is not None:
+            self.results.close()
+        if self.net is not None:
+            self.net.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.replay is not None:
+            self.replay.close()
+        if self.profiler.enabled:
+            self.profiler.export(self.profile_output)
+        pygame.quit()
 
-    @staticmethod
-    def display_text(window, text1, text2, font, position1, position2, color=BLACK):
+    def flip_card(self, index, face_up=True, on_done=None, keep=False):
+        """
+        flipping card animation: the visible side shrinks to the middle, then the other side expands.
+        runs on the animation scheduler, so it doesn't block the game loop
+        :param index:
+        :param face_up: True to turn the face up, False to turn the back up
+        :param on_done: called when the flip is over
+        :param keep: keep showing the new side after the flip, even if the card is not revealed
+        :return:
+        """
+        def width(progress):  # snap to the widths prepared in the surface cache
+            return self.flip_widths[round(progress * FLIP_FRAMES)]
+
+        def hiding(progress):
+            self.flips[index] = (width(1 - progress), not face_up)
+            self.changed_cards.add(index)
+
+        def revealing(progress):
+            self.flips[index] = (width(progress), face_up)
+            self.changed_cards.add(index)
+
+        def finished():
+            if not keep:
+                self.flips.pop(index, None)
+                self.changed_cards.add(index)
+            if on_done is not None:
+                on_done()
+
+        # First phase: shrinking the card to the middle, second phase: expanding the other side
+        self.flips[index] = (self.card_width, not face_up)
+        self.changed_cards.add(index)
+        self.animations.animate(FLIP_TIME, hiding,
+                                lambda: self.animations.animate(FLIP_TIME, revealing, finished))
+
+    def display_text(self, window, text1, text2, font, position1, position2, color=BLACK):
         """
         helper function to display text
         :param window:
@@ -230,11 +476,11 @@ class MemoryGame:
         :param color:
         :return:
         """
-        text_surface1 = font.render(text1, True, color)
+        text_surface1 = self.text_cache.get(text1, font, color)
         text_rect1 = text_surface1.get_rect(**position1)
         window.blit(text_surface1, text_rect1)
 
-        text_surface2 = font.render(text2, True, color)
+        text_surface2 = self.text_cache.get(text2, font, color)
         text_rect2 = text_surface2.get_rect(**position2)
         window.blit(text_surface2, text_rect2)
 
@@ -242,24 +488,23 @@ class MemoryGame:
 
     def check_match(self):
         """
-        logic function to check if a pair of cards is matched
+        check if the selected pair of cards is matched and give feedback
         :return:
         """
-        if len(self.selected) == 2:
-            if self.images[self.selected[0]] == self.images[self.selected[1]]:
-                self.matched.extend(self.selected)
-                self.match_sound.play()  # Play positive sound when a match is made
-            else:
-                # Hide the cards if they don't match
-                self.revealed[self.selected[0]] = False
-                self.revealed[self.selected[1]] = False
-
-            if self.num_players == 2 and self.images[self.selected[0]] != self.images[self.selected[1]]:
-                self.player_turn = 1 if self.player_turn == 2 else 2
-            self.selected.clear()
-
-        if len(self.matched) == len(self.images):
-            self.win_sound.play()  # Play win sound when all matches are made
+        selected = list(self.state.selected)
+        matched = self.state.check_match()
+        if self.net is not None and self.net_turn is not None:
+            self.state.player_turn = self.net_turn  # the server decides
+        if matched:
+            self.changed_cards.update(selected)  # matched cards leave the board
+            self.audio.play("match")  # Play positive sound when a match is made
+        elif matched is not None:
+            # Turn the cards back over if they don't match
+            for index in selected:
+                self.flip_card(index, face_up=False)
+
+        if self.state.is_won():
+            self.audio.play("win")  # Play win sound when all matches are made
 
     def win_screen(self, winner):
         """
@@ -270,39 +515,73 @@ class MemoryGame:
         if winner:
             message = "Well Done!"
             button_text = "Play Again"
-            message_surface = self.FONT.render(message, True, BLACK)
-            button_surface = self.FONT.render(button_text, True, BLACK)
+            message_surface = self.text_cache.get(message, self.FONT, BLACK)
+            button_surface = self.text_cache.get(button_text, self.FONT, BLACK)
             message_rect = message_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
             button_rect = button_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
 
             pygame.draw.rect(self.WINDOW, GREEN, (WIDTH // 4, HEIGHT // 4, WIDTH // 2, HEIGHT // 2))
+            self.dirty_rects.append(pygame.Rect(WIDTH // 4, HEIGHT // 4, WIDTH // 2, HEIGHT // 2))
             self.WINDOW.blit(message_surface, message_rect)
             pygame.draw.rect(self.WINDOW, BLACK, button_rect, 2)
             self.WINDOW.blit(button_surface, button_rect)
         else:
             message = "Game Over!"
             button_text = "Try Again"
-            message_surface = self.FONT.render(message, True, BLACK)
-            button_surface = self.FONT.render(button_text, True, BLACK)
+            message_surface = self.text_cache.get(message, self.FONT, BLACK)
+            button_surface = self.text_cache.get(button_text, self.FONT, BLACK)
             message_rect = message_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2 - 50))
             button_rect = button_surface.get_rect(center=(WIDTH // 2, HEIGHT // 2 + 50))
 
             pygame.draw.rect(self.WINDOW, RED, (WIDTH // 4, HEIGHT // 4, WIDTH // 2, HEIGHT // 2))
+            self.dirty_rects.append(pygame.Rect(WIDTH // 4, HEIGHT // 4, WIDTH // 2, HEIGHT // 2))
             self.WINDOW.blit(message_surface, message_rect)
             pygame.draw.rect(self.WINDOW, BLACK, button_rect, 2)
             self.WINDOW.blit(button_surface, button_rect)
 
         return button_rect  # Return the rectangle of the button for click detection
 
-    def get_hint(self):
+    def show_result(self, winner):
         """
-        helper function to get a random index of a card to be revealed (shortly) for a hint (only for 1 player)
+        switch to the win / game over window. the board is repainted once without the HUD and the window
+        is drawn on top of it
+        :param winner:
         :return:
         """
-        if self.num_players == 1:  # Check if the game is in 1 player mode
-            unmatched_indices = [i for i, value in enumerate(self.revealed) if not value and i not in self.matched]
-            if unmatched_indices:
-                self.hint_index = random.choice(unmatched_indices)
+        if self.game_over:
+            return  # already on screen
+        self.game_over = True
+        self.record_result(WON if winner else LOST)
+        self.animations.clear()  # nothing may be drawn over the result window
+        self.flips = {}
+        self.invalidate()
+        self.draw_board()
+        self.reset_text_rect = self.win_screen(winner)
+
+    def mode_name(self):
+        """
+        :return: the mode being played (one of results.MODES), None in the menu
+        """
+        if self.net is not None:
+            return "online"
+        if self.time_attack:
+            return "time_attack"
+        if self.voice_control:
+            return "voice"
+        return {1: "1_player", 2: "2_players"}.get(self.num_players)
+
+    def record_result(self, outcome):
+        """
+        save how the current game went. only queued here, the result store writes it on its own thread
+        :param outcome: results.WON, LOST or ABANDONED
+        :return:
+        """
+        mode = self.mode_name()
+        if self.results is None or mode is None or self.start_time is None:
+            return
+        self.results.add(self.player, mode, self.rows, self.cols, outcome, self.frame_time - self.start_time,
+                         self.time_limit if self.time_attack else None,
+                         self.state.max_hints - self.state.hints_remaining, self.state.moves, self.state.seed)
 
     def hint_processing(self, x, y):
         """
@@ -313,11 +592,28 @@ class MemoryGame:
         # hint_button_rect = hint_surface.get_rect(topleft=(WIDTH - 210, HEIGHT - 38))
         # hint_button_rect = pygame.Rect(WIDTH - 210, HEIGHT - 38, 80, 30)
         if self.hint_rect.collidepoint(x, y):
-            self.get_hint()
-            if self.hint_index is not None:
-                self.hints_remaining -= 1
-                pygame.time.set_timer(pygame.USEREVENT, 3000, True)
-                self.flip_animation_step(self.hint_index, True)
+            self.use_hint()
+
+    def use_hint(self):
+        """
+        spend one hint and briefly reveal a random unmatched card
+        :return:
+        """
+        if self.hint_index is not None:
+            return  # the previous hint is still showing
+        # cards turning back after a mismatch are no longer revealed, but still animating
+        self.hint_index = self.state.hint(exclude=self.flips)
+        if self.hint_index is not None:
+            index = self.hint_index
+
+            def hide():
+                self.flip_card(index, face_up=False, on_done=done)
+
+            def done():
+                self.hint_index = None
+
+            # reveal, wait, then turn the card back over
+            self.flip_card(index, keep=True, on_done=lambda: self.animations.after(HINT_TIME, hide))
 
     def card_selection_processing(self, row, col):
         """
@@ -326,33 +622,32 @@ class MemoryGame:
         :param col:
         :return: current player's turn
         """
-        if self.voice_index:  # if in voice control mode
-            if self.voice_index == -1:
-                index = 0
-            else:
-                index = self.voice_index
-        else:  # if in "regular" clicking mode
-            index = row * COLS + col
-        if not self.revealed[index] and len(self.selected) < 2:
-            self.flip_animation_step(index)
-            self.revealed[index] = True
-            self.selected.append(index)
-            if len(self.selected) == 2:  # if the user selected two cards --> updating board and checking for a match
-                self.draw_board()
-                pygame.display.update()
-                time.sleep(1)
-                self.check_match()
-        elif len(self.selected) == 1 and self.selected[0] == index:
-            # If the same card is clicked twice, keep it revealed
-            self.revealed[index] = True
-
-        return self.player_turn
+        index = row * self.cols + col
+        if index in self.flips:
+            return self.state.player_turn  # ignore clicks on a card that is still turning (e.g. a hint)
+        if self.state.select(index):
+            self.show_selected(index)
+
+        return self.state.player_turn
+
+    def show_selected(self, index):
+        """
+        turn a selected card face up
+        :param index:
+        :return:
+        """
+        if len(self.state.selected) == 2:  # if the user selected two cards --> checking for a match once both are seen
+            self.flip_card(index, on_done=lambda: self.animations.after(MATCH_CHECK_DELAY, self.check_match))
+        else:
+            self.flip_card(index)
 
     @staticmethod
-    def load_card_images():
+    def load_card_images(pairs=CARD_IMAGES):
         """
         load images for the game
-        :return:
+        :param pairs: number of different faces needed
+        :return: card faces from image files (the list index is the card id, there may be fewer than pairs)
+                 and the card back
         """
         images = [
             pygame.image.load("image1.png"),  # Replace "image1.png" with the path to your image file
@@ -366,7 +661,25 @@ class MemoryGame:
         ]
         card_back = pygame.image.load("card_back.png")
 
-        return images, card_back
+        return images[:pairs], card_back
+
+    @staticmethod
+    def make_card_face(card_id, font):
+        """
+        generated face for boards with more pairs than image files: a distinct color and the pair number
+        :param card_id:
+        :param font: font for the number
+        :return: face surface
+        """
+        hue = card_id * 0.618033988749895 % 1  # golden ratio steps keep neighbouring ids apart
+        shade = 0.95 - card_id // 40 % 3 * 0.25
+        color = [round(channel * 255) for channel in colorsys.hsv_to_rgb(hue, 0.6, shade)]
+        face = pygame.Surface((CARD_WIDTH, CARD_HEIGHT))
+        face.fill(color)
+        pygame.draw.rect(face, BLACK, face.get_rect(), 3)
+        number = font.render(str(card_id + 1), True, BLACK)
+        face.blit(number, number.get_rect(center=face.get_rect().center))
+        return face
 
     def draw_main_win_buttons(self):
         """
@@ -383,78 +696,242 @@ class MemoryGame:
         self.display_text(self.WINDOW, "Time Attack", "", self.FONT, {"center": (200, 100)}, {"center": (200, 100)})
         self.display_text(self.WINDOW, "Voice Control", "", self.FONT, {"center": (200, 50)}, {"center": (200, 50)})
 
+    def draw_menu(self):
+        """
+        draw the game modes window
+        :return:
+        """
+        self.WINDOW.fill(LIGHT_BLUE)
+        self.draw_main_win_buttons()
+        help_surface = self.text_cache.get("L: leaderboard", self.small_font, BLACK)
+        self.WINDOW.blit(help_surface, help_surface.get_rect(midbottom=(WIDTH // 2, HEIGHT - 20)))
+        pygame.display.update()
+
+    def draw_leaderboard(self, page):
+        """
+        draw one page of the leaderboard window
+        :param page: one of results.MODES (fastest won games on this board) or "history" (the player's games)
+        :return:
+        """
+        self.WINDOW.fill(LIGHT_BLUE)
+        if page == "history":
+            title = f"{self.player}'s games"
+            lines = []
+            for played_at, mode, rows, cols, outcome, elapsed, moves in (self.results.history(self.player)
+                                                                          if self.results is not None else ()):
+                minutes, seconds = divmod(int(elapsed), 60)
+                lines.append(f"{time.strftime('%d/%m %H:%M', time.localtime(played_at))}  {MODE_TITLES[mode]} "
+                             f"{rows}x{cols}  {outcome}  {minutes:02d}:{seconds:02d}")
+        else:
+            title = f"{MODE_TITLES[page]} {self.rows}x{self.cols}"
+            lines = []
+            for place, (player, elapsed, moves, hints_used, _) in enumerate(
+                    self.results.leaderboard(page, self.rows, self.cols) if self.results is not None else (), 1):
+                minutes, seconds = divmod(int(elapsed), 60)
+                lines.append(f"{place}. {player}  {minutes:02d}:{seconds:02d}  {moves} moves  {hints_used} hints")
+        if not lines:
+            lines = ["No games yet"]
+
+        title_surface = self.text_cache.get(title, self.FONT, BLUE)
+        self.WINDOW.blit(title_surface, title_surface.get_rect(midtop=(WIDTH // 2, 20)))
+        for number, line in enumerate(lines):
+            self.WINDOW.blit(self.text_cache.get(line, self.small_font, BLACK), (20, 70 + number * 28))
+        help_surface = self.text_cache.get("Left / Right: more   Esc: menu", self.small_font, BLACK)
+        self.WINDOW.blit(help_surface, help_surface.get_rect(midbottom=(WIDTH // 2, HEIGHT - 20)))
+        pygame.display.update()
+
+    def show_leaderboard(self):
+        """
+        leaderboard window opened from the menu: the fastest games of every mode on this board size and the
+        player's latest games. both come from indexed queries, so they show up right away
+        :return:
+        """
+        pages = MODES + ("history",)
+        page = 0
+        self.draw_leaderboard(pages[page])
+        while True:
+            for event in self.next_events(wait=True):
+                if event.type == pygame.WINDOWEXPOSED:
+                    pygame.display.update()
+                if event.type == pygame.QUIT:
+                    self.close()
+                    sys.exit()
+                if event.type == pygame.MOUSEBUTTONDOWN:
+                    return
+                if event.type == pygame.KEYDOWN:
+                    if event.key in (pygame.K_ESCAPE, pygame.K_l):
+                        return
+                    if event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                        page = (page + (1 if event.key == pygame.K_RIGHT else -1)) % len(pages)
+                        self.draw_leaderboard(pages[page])
+
     def game_reset(self):
         """
         reset all game parameters for a new game
         :return:
         """
-        self.revealed = [False] * (ROWS * COLS)
-        self.selected = []
-        self.matched = []
-        random.shuffle(self.images)  # reshuffle the cards
-        self.hints_remaining = MAX_HINTS  # reset hints
+        if not self.game_over and self.state.moves:
+            self.record_result(ABANDONED)
+        self.state.reset(self.seeds.randrange(2 ** 32))  # reshuffle the cards, reset hints and player turn
         self.hint_index = None
-        self.start_time = time.time()  # reset time
+        self.animations.clear()  # drop flips and pending match checks of the old game
+        self.flips = {}
+        self.start_time = self.frame_time  # reset time
         self.elapsed_time = None
         self.game_over = False
-        self.voice_index = None
-        self.player_turn = 1  # reset player turn (for 2 player mode)
+        self.invalidate()
 
     def game_mode_window(self, timer_text):
         """
-        handling actual game mode window
+        handling actual game mode window. each widget is redrawn only when its text changes
         :return:
         """
-        self.reset_text_rect = self.display_text(self.WINDOW, timer_text, "Reset", self.FONT,
-                                                 position1={"bottomleft": (10, HEIGHT - 10)},
-                                                 position2={"bottomright": (WIDTH - 10, HEIGHT - 10)})
+        def render_text(text, color, **position):
+            surface = self.text_cache.get(text, self.FONT, color)
+            rect = surface.get_rect(**position)
+            self.WINDOW.blit(surface, rect)
+            return rect
 
-        menu_surface = self.FONT.render("Menu", True, BLUE)
-        self.menu_rect = menu_surface.get_rect(topleft=(WIDTH - 85, HEIGHT - 65))
-        pygame.draw.rect(self.WINDOW, WHITE, self.menu_rect)
-        self.WINDOW.blit(menu_surface, self.menu_rect)
+        self.draw_widget("timer", timer_text, lambda: render_text(timer_text, BLACK, bottomleft=(10, HEIGHT - 10)))
+        self.reset_text_rect = self.draw_widget(
+            "reset", "Reset", lambda: render_text("Reset", BLACK, bottomright=(WIDTH - 10, HEIGHT - 10)))
 
-        if self.voice_control:
-            small_font_size = 25
-            small_font = pygame.font.Font(None, small_font_size)  # Create a new Font object for the smaller text
+        def render_menu():
+            menu_surface = self.text_cache.get("Menu", self.FONT, BLUE)
+            menu_rect = menu_surface.get_rect(topleft=(WIDTH - 85, HEIGHT - 65))
+            pygame.draw.rect(self.WINDOW, WHITE, menu_rect)
+            self.WINDOW.blit(menu_surface, menu_rect)
+            return menu_rect
 
-            info_text = "Say 'number' followed by the card number (1-16)"
-            info_text_surface = small_font.render(info_text, True, BLACK)
-            info_text_rect = info_text_surface.get_rect(midbottom=(WIDTH - 196, HEIGHT - 75))
-            self.WINDOW.blit(info_text_surface, info_text_rect)
+        self.menu_rect = self.draw_widget("menu", "Menu", render_menu)
 
-        # Display "Hint" button
-        hint_text = f"Hints: {self.hints_remaining}"
-        hint_surface = self.FONT.render(hint_text, True, BLACK)
-        self.hint_rect = hint_surface.get_rect(topleft=(WIDTH - 210, HEIGHT - 38))
+        if self.voice_control:
+            def render_info():
+                info_text_surface = self.text_cache.get(info_text, self.small_font, BLACK)
+                info_text_rect = info_text_surface.get_rect(midbottom=(WIDTH - 196, HEIGHT - 75))
+                self.WINDOW.blit(info_text_surface, info_text_rect)
+                return info_text_rect
+
+            info_text = "Say 'number 1-16', 'hint', 'reset' or 'menu'"
+            self.draw_widget("voice info", info_text, render_info)
+
+        if self.net is not None:
+            def render_net():
+                net_surface = self.text_cache.get(net_text, self.small_font, BLUE)
+                net_rect = net_surface.get_rect(midbottom=(WIDTH - 196, HEIGHT - 75))
+                self.WINDOW.blit(net_surface, net_rect)
+                return net_rect
+
+            if self.net_status is not None:
+                net_text = f"Online as P{self.net.player}: {self.net_status}"
+            elif self.state.player_turn == self.net.player:
+                net_text = f"Online as P{self.net.player}: your turn"
+            else:
+                net_text = f"Online as P{self.net.player}: the other player's turn"
+            self.draw_widget("net", net_text, render_net)
 
-        if self.num_players == 2 or self.time_attack or self.voice_control:
-            pygame.draw.rect(self.WINDOW, RED, self.hint_rect)
+        # Display "Hint" button
+        hint_text = f"Hints: {self.state.hints_remaining}"
+        if self.state.num_players == 1:  # 1 player and voice games
+            hint_color = GREEN
         else:
-            pygame.draw.rect(self.WINDOW, GREEN, self.hint_rect)
-        self.WINDOW.blit(hint_surface, self.hint_rect)
+            hint_color = RED
+
+        def render_hint():
+            hint_surface = self.text_cache.get(hint_text, self.FONT, BLACK)
+            hint_rect = hint_surface.get_rect(topleft=(WIDTH - 210, HEIGHT - 38))
+            pygame.draw.rect(self.WINDOW, hint_color, hint_rect)
+            self.WINDOW.blit(hint_surface, hint_rect)
+            return hint_rect
+
+        self.hint_rect = self.draw_widget("hint", (hint_text, hint_color), render_hint)
 
         # Display player turn
-        player_turn_text = f"P{self.player_turn}"
-        player_turn_surface = self.FONT.render(player_turn_text, True, BLUE)
-        player_turn_rect = player_turn_surface.get_rect(midbottom=(WIDTH - 20, HEIGHT // 2))
-        self.WINDOW.blit(player_turn_surface, player_turn_rect)
+        player_turn_text = f"P{self.state.player_turn}"
+        self.draw_widget("player turn", player_turn_text,
+                         lambda: render_text(player_turn_text, BLUE, midbottom=(WIDTH - 20, HEIGHT // 2)))
+
+    @staticmethod
+    def wait_events(timeout=None):
+        """
+        sleep until something happens instead of polling
+        :param timeout: milliseconds to wait at most, None to wait for the next event
+        :return: list of events (empty on timeout)
+        """
+        event = pygame.event.wait() if timeout is None else pygame.event.wait(timeout)
+        events = [] if event.type == pygame.NOEVENT else [event]
+        return events + pygame.event.get()
+
+    def next_frame_timeout(self):
+        """
+        how long the game loop may sleep when nothing is animating
+        :return: milliseconds until the timer text changes, or None when no timer is shown
+        """
+        if self.game_over:
+            return None
+        # both the clock and the time attack countdown tick on whole seconds since start_time
+        return int((1 - (time.time() - self.clock_start - self.start_time) % 1) * 1000) + 1
+
+    def next_events(self, wait, timeout=None):
+        """
+        input for the next frame: live events (also written to the session log when recording) or the next
+        frame of a replay. sets the frame time
+        :param wait: sleep until an event arrives (or the timeout passes) instead of polling
+        :param timeout: milliseconds to wait at most, None to wait for the next event
+        :return: list of events
+        """
+        if self.replay is not None:
+            # only closing or uncovering the window is taken from the live queue
+            live = [event for event in pygame.event.get() if event.type in (pygame.QUIT, pygame.WINDOWEXPOSED)]
+            frame = self.replay.next_frame()
+            if frame is None:  # end of the log
+                return live + [pygame.event.Event(pygame.QUIT)]
+            self.frame_time, events = frame
+            return live + events
+
+        events = self.wait_events(timeout) if wait else pygame.event.get()
+        self.frame_time = time.time() - self.clock_start
+        if self.recorder is not None:
+            self.recorder.frame(self.frame_time, events)
+        return events
+
+    def tick(self):
+        """
+        end of a frame: frame rate control, the frame time comes from the log when replaying
+        :return: seconds since the last frame
+        """
+        if self.replay is not None:
+            milliseconds = self.replay.tick(state_checksum(self.state))
+        else:
+            milliseconds = self.clock.tick(FPS)
+            if self.recorder is not None:
+                self.recorder.tick(milliseconds, state_checksum(self.state))
+        return milliseconds / 1000
 
     def process_game_mode(self):
         """
-        handling the mode the user chose
+        handling the mode the user chose. the menu is static, so it is drawn once and the loop sleeps
+        until the next event
         :return:
         """
         self.num_players = 0
         self.time_attack = False
         self.voice_control = False
+        self.draw_menu()
         while self.num_players == 0 and (not self.time_attack and not self.voice_control):
-            for event in pygame.event.get():
+            for event in self.next_events(wait=True):
+                if event.type == pygame.WINDOWEXPOSED:
+                    pygame.display.update()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_d:
+                    self.switch_deck()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_l:
+                    self.show_leaderboard()
+                    self.draw_menu()
                 if event.type == pygame.QUIT:
-                    pygame.quit()
+                    self.close()
                     sys.exit()
                 if event.type == pygame.MOUSEBUTTONDOWN:
-                    x, y = pygame.mouse.get_pos()
+                    x, y = event.pos
                     if self.rect_list[0].collidepoint(x, y):
                         self.num_players = 1
                     elif self.rect_list[1].collidepoint(x, y):
@@ -464,77 +941,351 @@ class MemoryGame:
                     elif self.rect_list[3].collidepoint(x, y):
                         self.voice_control = True
 
-            self.start_time = time.time()  # Start time
+        self.prepare_assets()
+        self.start_time = self.frame_time  # Start time
+        self.state.num_players = 1 if self.voice_control else self.num_players  # a voice game is played alone
 
-            self.WINDOW.fill(LIGHT_BLUE)
-            self.draw_main_win_buttons()
-            pygame.display.update()
+        self.invalidate()  # the menu covered the whole window
+
+        # listen in the background only while a voice game is on (a replay has the commands in its log)
+        if self.voice_control and self.replay is None:
+            self.speech_recognition()
+        elif self.voice_engine is not None:
+            self.voice_engine.stop()
+
+    def start_online(self, net):
+        """
+        play a networked 2 player game instead of picking a mode in the menu
+        :param net: NetClient that joined a room
+        :return:
+        """
+        self.net = net
+        self.num_players = 2
+        self.state.num_players = 2
+        self.net_status = "waiting for the other player"
+        self.prepare_assets()
+        self.start_time = self.frame_time
+        self.invalidate()
+        net.listen(self.post_net_message)
+
+    @staticmethod
+    def post_net_message(message, fields):
+        """
+        network thread callback. hands a server message over to the game loop
+        :param message: netplay server message type
+        :param fields:
+        :return:
+        """
+        pygame.event.post(pygame.event.Event(NET_EVENT, message=message, fields=fields))
+
+    def net_message_processing(self, message, fields):
+        """
+        queue a server message and apply what can be applied. the server never waits for the animations, so
+        a card may be revealed while this client still shows the last pair: it (and everything after it)
+        waits until the pair is resolved. no server message is ever dropped
+        :param message: netplay server message type
+        :param fields:
+        :return:
+        """
+        self.net_queue.append((message, fields))
+        self.apply_net_messages()
+
+    def apply_net_messages(self):
+        """
+        apply queued server messages in order, up to the first card that can't be turned yet
+        :return:
+        """
+        import netplay
+
+        while self.net_queue:
+            message, fields = self.net_queue[0]
+            if message == netplay.REVEAL and (len(self.state.selected) == 2 or fields[0] in self.flips):
+                return  # the last pair is still shown, or this card is still turning back
+            self.net_queue.popleft()
+            self.apply_net_message(message, fields)
+
+    def apply_net_message(self, message, fields):
+        """
+        apply a server message to the local view of the board. cards are turned and pairs checked with the
+        same animations as a local game
+        :param message: netplay server message type
+        :param fields:
+        :return:
+        """
+        import netplay
+
+        if message == netplay.START:
+            self.game_reset()
+            for index in range(self.state.size):
+                self.state.cards[index] = 0  # unknown until the server reveals it
+            self.state.player_turn = fields[0]
+            self.net_turn = None
+            self.net_pairs = None
+            self.net_status = None
+            self.net_selections.clear()
+        elif message == netplay.REVEAL:
+            index, card_id, sequence = fields
+            self.net_selections.pop(sequence, None)
+            self.state.cards[index] = card_id
+            if self.state.select(index):  # apply_net_messages waited until it can be turned
+                self.show_selected(index)
+        elif message == netplay.REJECT:
+            sequence, retry = fields
+            index = self.net_selections.pop(sequence, None)
+            if index is not None and retry:
+                # sent before the server was done with the last pair, ask again once it is (if still possible)
+                self.animations.after(retry / 1000, lambda: self.net_select(*divmod(index, self.cols)))
+        elif message == netplay.RESULT:
+            self.net_turn = fields[3]  # applied once the pair was shown
+        elif message == netplay.GAME_OVER:
+            self.net_pairs = fields
+        elif message == netplay.LEFT:
+            if fields[0] == 0:
+                self.net_status = "disconnected"
+            else:
+                self.net_status = f"P{fields[0]} left, waiting for a new player"
+
+    def net_select(self, row, col):
+        """
+        ask the server to turn a card, if it is this player's turn, nothing is being shown and the last
+        selection was answered
+        :param row:
+        :param col:
+        :return:
+        """
+        index = row * self.cols + col
+        if (self.net_status is None and self.state.player_turn == self.net.player and len(self.state.selected) < 2
+                and index not in self.flips and not self.state.revealed[index] and not self.net_selections):
+            self.net_selections[self.net.select(index)] = index
+
+    def is_winner(self):
+        """
+        :return: False only for the player with fewer pairs at the end of a networked game
+        """
+        if self.net is None or self.net_pairs is None:
+            return True
+        return self.net_pairs[self.net.player - 1] == max(self.net_pairs)
+
+    def voice_command_processing(self, command, index):
+        """
+        handle a spoken command the same way as the matching click
+        :param command: "card", "reset", "hint" or "menu"
+        :param index: card index for "card" commands
+        :return:
+        """
+        if command == "menu":  # go back to the modes window
+            self.game_reset()
+            self.process_game_mode()
+        elif command == "reset":
+            self.game_reset()
+        elif self.game_over:
+            return
+        elif command == "card":
+            if index < self.rows * self.cols:
+                row, col = divmod(index, self.cols)
+                self.card_selection_processing(row, col)
+        elif command == "hint" and self.state.hints_remaining > 0 and self.state.num_players == 1:
+            self.use_hint()
 
     def game_loop(self):
         while self.running:
-            for event in pygame.event.get():
+            # full frame rate only while something moves, otherwise sleep until an event, the next timer
+            # second or the end of a pending delay (match check, hint)
+            self.profiler.start_frame()
+            animating = self.animations.moving
+            timeout = self.next_frame_timeout()
+            delay = None if animating else self.animations.next_start()
+            if delay is not None:
+                timeout = int(delay * 1000) + 1 if timeout is None else min(timeout, int(delay * 1000) + 1)
+            events = self.next_events(wait=not animating, timeout=timeout)
+            self.animations.begin_frame()
+            self.profiler.mark("wait")
+            for event in events:
                 if event.type == pygame.QUIT:
                     self.running = False
-                if self.voice_control:
-                    self.voice_index = self.speech_recognition()
-                if not self.game_over and event.type == pygame.MOUSEBUTTONDOWN or self.voice_control:
-                    x, y = pygame.mouse.get_pos()
-                    col = x // (CARD_WIDTH + GAP)
-                    row = y // (CARD_HEIGHT + GAP)
-                    if col < COLS and row < ROWS or self.voice_index:  # Check if the click is within the grid
-                        self.card_selection_processing(row, col)
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.invalidate()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_d:
+                    self.switch_deck()
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    self.toggle_overlay()
+                if not self.game_over and event.type == pygame.MOUSEBUTTONDOWN:
+                    x, y = event.pos
+                    card = self.card_at(x, y)
+                    if card is not None and self.net is not None:  # the server turns the card
+                        self.net_select(*card)
+                    elif card is not None:  # Check if the click is within the grid
+                        self.card_selection_processing(*card)
+                    elif self.net is not None:
+                        pass  # no menu, reset or hints in a networked game
                     elif self.menu_rect.collidepoint(x, y):  # go back to the modes window
                         self.game_reset()
                         self.process_game_mode()
                     elif self.reset_text_rect is not None and self.reset_text_rect.collidepoint(x, y):
                         self.game_reset()
-                    elif self.hints_remaining > 0 and self.num_players == 1:  # handling hints updates (for 1 player mode)
+                    elif self.state.hints_remaining > 0 and self.state.num_players == 1:  # hints (1 player and voice mode)
                         self.hint_processing(x, y)
+                elif event.type == VOICE_EVENT:
+                    self.voice_command_processing(event.command, event.index)
+                elif event.type == NET_EVENT:
+                    self.net_message_processing(event.message, event.fields)
                 elif self.game_over and event.type == pygame.MOUSEBUTTONDOWN:
-                    x, y = pygame.mouse.get_pos()
+                    x, y = event.pos
                     if self.reset_text_rect is not None and self.reset_text_rect.collidepoint(x, y):
-                        self.game_reset()
-                elif event.type == pygame.USEREVENT:
-                    # Timer event to hide the hint card
-                    self.hint_index = None
+                        if self.net is not None:
+                            self.net.restart()  # the server starts the new game for both players
+                        else:
+                            self.game_reset()
+
+            self.profiler.mark("events")
 
             # Calculate elapsed time
             if self.time_attack:
-                self.elapsed_time = self.time_limit - (time.time() - self.start_time)
+                self.elapsed_time = self.time_limit - (self.frame_time - self.start_time)
             else:
-                self.elapsed_time = time.time() - self.start_time
+                self.elapsed_time = self.frame_time - self.start_time
             minutes = int(self.elapsed_time // 60)
             seconds = int(self.elapsed_time % 60)
             timer_text = f"Time: {minutes:02d}:{seconds:02d}"
 
-            self.draw_board(flip_animation={"index": self.hint_index, "width": CARD_WIDTH, "phase": "hiding"})
+            self.draw_board()
+            self.profiler.mark("board")
 
             # game stop conditions
             if self.elapsed_time < 0:  # checking if time is over (for attack mode)
-                self.game_over = True
-                self.reset_text_rect = self.win_screen(winner=False)
-            elif len(self.matched) == len(self.images):  # checking if all images were matched
-                self.game_over = True
-                self.reset_text_rect = self.win_screen(winner=True)
+                self.show_result(winner=False)
+            elif self.state.is_won():  # checking if all images were matched
+                self.show_result(winner=self.is_winner())
                 # Decrement time limit for Time Attack mode
                 if self.time_attack:
                     self.time_limit -= TIME_LIMIT_DECREMENT
                     self.game_reset()
             else:  # game continues
                 self.game_mode_window(timer_text)
-
-            pygame.display.update()
-            self.clock.tick(60)  # frame rate control
-
-        pygame.quit()
+            self.profiler.mark("hud")
+
+            if self.show_overlay:
+                self.draw_overlay()
+                self.profiler.mark("overlay")
+
+            self.update_display()
+            self.profiler.mark("display")
+            dt = self.tick()  # frame rate control
+            self.profiler.mark("wait")
+            # after an idle sleep dt is long: pending delays count it, animations started on this frame
+            # begin from the next one
+            self.animations.update(dt, None if animating else 0)
+            if self.net_queue:
+                self.apply_net_messages()  # the pair they were waiting for may be resolved now
+            self.profiler.mark("animations")
+            self.profiler.end_frame()
+
+            if self.stats_interval is not None:
+                self.stats_frames += 1
+                if self.frame_time - self.stats_time >= self.stats_interval:
+                    print(f"fps {self.stats_frames / (self.frame_time - self.stats_time):.1f}", flush=True)
+                    self.stats_time, self.stats_frames = self.frame_time, 0
+
+        self.close()
+
+
+def seconds_since_process_start():
+    """
+    process age, for startup measurements
+    :return: seconds since the process started (linux), or since this module was imported
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter() - START_TIME
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Memory Game")
+    parser.add_argument("--board", type=board_size, default=(ROWS, COLS), help="board size, e.g. 8x8 (default 4x4)")
+    parser.add_argument("--deck", nargs="+", default=[], help="deck files built with deck.py, D switches between them")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"time every frame from the start (F3 also starts it) and write {PROFILE_OUTPUT}.json/.csv at exit")
+    parser.add_argument("--profile-output", default=PROFILE_OUTPUT, help="file name for the frame profile, without extension")
+    parser.add_argument("--seed", type=int, help="session seed, the card layouts of every game follow from it")
+    parser.add_argument("--record", metavar="LOG", help="write the session seed and every input to this file")
+    parser.add_argument("--replay", metavar="LOG", help="play a recorded session back through the same handlers")
+    parser.add_argument("--fast", action="store_true", help="replay without a window or sound, as fast as possible")
+    parser.add_argument("--connect", metavar="HOST:PORT",
+                        help="play a networked 2 player game on a netplay.py server")
+    parser.add_argument("--room", default="lobby", help="room to join on the server")
+    parser.add_argument("--player", default=DEFAULT_PLAYER, help="name your results are saved under")
+    parser.add_argument("--results", default=RESULTS_DB, help="database the game results are saved to")
+    parser.add_argument("--voice-service", metavar="HOST:PORT",
+                        help="decode voice commands in a voice_service.py recognizer instead of loading the model")
+    parser.add_argument("--stats-interval", type=float, metavar="SECONDS", help="print the frame rate this often")
+    parser.add_argument("--startup-time", action="store_true", help="print the time to the first menu frame and exit")
+    args = parser.parse_args()
+    if args.connect and (args.record or args.replay):
+        # a log holds the local input only, the server's part of a networked game can't be played back
+        parser.error("--record and --replay can't be used with --connect")
+
     # create game
-    game = MemoryGame()
+    replay = None
+    if args.replay:
+        replay = Replay(args.replay, VOICE_EVENT, real_time=not args.fast)
+        args.board, args.seed = (replay.rows, replay.cols), replay.seed
+        if args.fast:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            os.environ["SDL_AUDIODRIVER"] = "dummy"
+    voice_service = None
+    if args.voice_service:
+        from netplay import address
+
+        try:
+            voice_service = address(args.voice_service)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+    net = None
+    if args.connect:
+        import netplay  # asyncio is only imported for networked games
+
+        try:
+            host, port = netplay.address(args.connect)
+        except argparse.ArgumentTypeError as e:
+            parser.error(str(e))
+        net = netplay.NetClient(host, port, args.room)
+        try:
+            _, rows, cols = net.connect()
+        except ConnectionError as e:
+            parser.error(str(e))
+        if max(rows, cols) > MAX_BOARD_SIDE:
+            net.close()
+            parser.error(f"the server's {rows}x{cols} board doesn't fit on the screen")
+        args.board = rows, cols  # the server's board
+    game = MemoryGame(*args.board, decks=args.deck, profile=args.profile, seed=args.seed)
+    game.profile_output = args.profile_output
+    game.replay = replay
+    if args.record:
+        game.recorder = Recorder(args.record, game.rows, game.cols, game.seed, VOICE_EVENT)
+
+    if args.startup_time:
+        game.draw_menu()
+        print(f"first menu frame after {seconds_since_process_start() * 1000:.0f} ms")
+        game.prepare_assets()  # let the loader finish before shutting down
+        pygame.quit()
+        return
+
+    game.player = args.player
+    game.stats_interval = args.stats_interval
+    game.voice_service = voice_service
+    if replay is None:  # a replayed session was saved when it was played
+        game.results = ResultStore(args.results)
 
     # game mode
-    game.process_game_mode()
+    if net is not None:
+        game.start_online(net)
+    else:
+        game.process_game_mode()
 
     # game loop
     game.game_loop()
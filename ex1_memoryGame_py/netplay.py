@@ -0,0 +1,353 @@
+import argparse
+import asyncio
+import signal
+import struct
+import threading
+import time
+
+from engine import GameState, ROWS, COLS, board_size
+
+PORT = 5555
+# seconds clients need to show a pair, no selections are accepted meanwhile: both cards flip up and stay for
+# MATCH_CHECK_DELAY, a matched pair then leaves the board while a mismatch is flipped back first
+MATCH_RESOLVE_TIME = 1.4
+RESOLVE_TIME = 1.8
+CONNECT_TIMEOUT = 5
+
+# Client -> server messages: one type byte followed by fixed size fields
+JOIN = 1  # u8 length + room name
+SELECT = 2  # card index, sequence number (echoed back, for round trip times)
+RESTART = 3  # new game in the same room
+CLIENT_MESSAGES = {JOIN: struct.Struct("<B"), SELECT: struct.Struct("<HI"), RESTART: struct.Struct("")}
+
+# Server -> client messages. only deltas are sent: a client learns a card id when it is turned over
+WELCOME = 1  # your player number, rows, cols
+START = 2  # a new game starts (every card face down), whose turn it is
+REVEAL = 3  # card index, card id, sequence number of the selection (0 if it was not yours)
+RESULT = 4  # first, second, matched, whose turn it is now
+REJECT = 5  # sequence number of a selection that was refused, milliseconds until it may be sent again (0 = never)
+GAME_OVER = 6  # pairs found by P1 and P2
+LEFT = 7  # player number of a player who left, the room waits for someone else
+FULL = 8  # the room already has two players
+SERVER_MESSAGES = {WELCOME: struct.Struct("<BHH"), START: struct.Struct("<B"), REVEAL: struct.Struct("<HHI"),
+                   RESULT: struct.Struct("<HHBB"), REJECT: struct.Struct("<IH"), GAME_OVER: struct.Struct("<HH"),
+                   LEFT: struct.Struct("<B"), FULL: struct.Struct("")}
+
+
+def encode(messages, message, *fields):
+    """
+    :param messages: CLIENT_MESSAGES or SERVER_MESSAGES
+    :param message: message type
+    :param fields:
+    :return: bytes to send
+    """
+    return bytes((message,)) + messages[message].pack(*fields)
+
+
+async def receive(reader, messages):
+    """
+    read one message
+    :param reader: asyncio StreamReader
+    :param messages: CLIENT_MESSAGES or SERVER_MESSAGES
+    :return: (message type, fields), fields of JOIN end with the room name
+    """
+    message = (await reader.readexactly(1))[0]
+    layout = messages[message]
+    fields = layout.unpack(await reader.readexactly(layout.size)) if layout.size else ()
+    if messages is CLIENT_MESSAGES and message == JOIN:
+        fields += ((await reader.readexactly(fields[0])).decode(),)
+    return message, fields
+
+
+class Room:
+    """
+    one 2 player game on the server. the server's GameState is the only real board: clients send the
+    card they pick and every change goes back to both players as a small delta
+    """
+
+    def __init__(self, name, rows, cols, resolve_times):
+        self.name = name
+        self.state = GameState(rows, cols, num_players=2, max_hints=0)
+        self.resolve_times = resolve_times  # (after a mismatch, after a match)
+        self.players = [None, None]  # StreamWriter of P1 and P2
+        self.pairs = [0, 0]  # pairs found by P1 and P2
+        self.playing = False
+        self.busy_until = 0  # no selections while the clients show the last pair
+
+    def broadcast(self, message, *fields):
+        data = encode(SERVER_MESSAGES, message, *fields)
+        for writer in self.players:
+            if writer is not None:
+                writer.write(data)
+
+    def join(self, writer):
+        """
+        :param writer:
+        :return: player number (1 or 2), or None if the room is full
+        """
+        if None not in self.players:
+            return None
+        player = self.players.index(None) + 1
+        self.players[player - 1] = writer
+        writer.write(encode(SERVER_MESSAGES, WELCOME, player, self.state.rows, self.state.cols))
+        if None not in self.players:
+            self.start()
+        return player
+
+    def leave(self, player):
+        self.players[player - 1] = None
+        self.playing = False
+        self.broadcast(LEFT, player)
+
+    def start(self):
+        self.state.reset()
+        self.pairs = [0, 0]
+        self.playing = True
+        self.busy_until = 0
+        self.broadcast(START, self.state.player_turn)
+
+    def select(self, player, index, sequence):
+        """
+        a player picks a card. refused unless it is the player's turn and the card can be turned
+        :param player:
+        :param index:
+        :param sequence: client's sequence number, echoed in the REVEAL or REJECT
+        :return:
+        """
+        state = self.state
+        now = time.monotonic()
+        if self.playing and player == state.player_turn and now < self.busy_until:
+            # too early, the client may send it again once the pair was shown
+            retry = min(int((self.busy_until - now) * 1000) + 1, 0xFFFF)
+            self.players[player - 1].write(encode(SERVER_MESSAGES, REJECT, sequence, retry))
+            return
+        if not self.playing or player != state.player_turn or not state.select(index):
+            self.players[player - 1].write(encode(SERVER_MESSAGES, REJECT, sequence, 0))
+            return
+        for number, writer in enumerate(self.players, 1):
+            if writer is not None:
+                writer.write(encode(SERVER_MESSAGES, REVEAL, index, state.cards[index],
+                                    sequence if number == player else 0))
+        if len(state.selected) < 2:
+            return
+
+        first, second = state.selected
+        matched = state.check_match()
+        if matched:
+            self.pairs[player - 1] += 1
+        self.broadcast(RESULT, first, second, matched, state.player_turn)
+        self.busy_until = now + self.resolve_times[matched]
+        if state.is_won():
+            self.playing = False
+            self.broadcast(GAME_OVER, *self.pairs)
+
+
+class Server:
+    """
+    asyncio server holding any number of rooms, one connection per player
+    """
+
+    def __init__(self, rows=ROWS, cols=COLS, resolve_time=RESOLVE_TIME, match_resolve_time=MATCH_RESOLVE_TIME):
+        self.rows, self.cols = rows, cols
+        self.resolve_times = (resolve_time, match_resolve_time)
+        self.rooms = {}  # name -> Room
+        self.moves = 0  # selections handled
+        self.tasks = set()  # connection handlers, cancelled when the server stops
+
+    async def handle(self, reader, writer):
+        """
+        one client connection: JOIN first, then selections until the connection closes
+        :param reader:
+        :param writer:
+        :return:
+        """
+        room, player = None, None
+        self.tasks.add(asyncio.current_task())
+        try:
+            message, fields = await receive(reader, CLIENT_MESSAGES)
+            if message != JOIN:
+                return
+            name = fields[-1]
+            room = self.rooms.get(name)
+            if room is None:
+                room = self.rooms[name] = Room(name, self.rows, self.cols, self.resolve_times)
+            player = room.join(writer)
+            if player is None:
+                writer.write(encode(SERVER_MESSAGES, FULL))
+                return
+            while True:
+                message, fields = await receive(reader, CLIENT_MESSAGES)
+                if message == SELECT:
+                    self.moves += 1
+                    room.select(player, *fields)
+                elif message == RESTART and None not in room.players:
+                    room.start()
+        except (asyncio.IncompleteReadError, ConnectionError, KeyError):
+            pass  # disconnected or a broken message
+        except asyncio.CancelledError:
+            pass  # the server is stopping
+        finally:
+            self.tasks.discard(asyncio.current_task())
+            if player is not None:
+                room.leave(player)
+                if room.players == [None, None]:
+                    del self.rooms[room.name]
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        """
+        serve until SIGINT / SIGTERM (Ctrl+C), then close every connection
+        :param host:
+        :param port: 0 picks a free port
+        :param ready: called with the port once the server listens
+        :return:
+        """
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(number, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # windows (or not the main thread): Ctrl+C raises KeyboardInterrupt instead
+        server = await asyncio.start_server(self.handle, host, port)  # asyncio sets TCP_NODELAY on its sockets
+        port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready(port)
+        async with server:
+            await stop.wait()
+            # stop listening, then close the connections by cancelling their handlers (before leaving the
+            # block, which waits for them on newer pythons)
+            server.close()
+            for task in list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+
+class NetClient:
+    """
+    game side of a networked game. the connection runs on its own thread with an asyncio loop, decoded
+    server messages are handed to on_message (from that thread), like the voice engine does
+    """
+
+    def __init__(self, host, port, room):
+        self.host, self.port, self.room = host, port, room
+        self.player = None
+        self.rows = self.cols = None
+        self.on_message = None  # called with (message, fields), messages before it is set are kept
+        self.pending = []
+        self.lock = threading.Lock()
+        self.welcome = threading.Event()
+        self.loop = None
+        self.writer = None
+        self.sequence = 0
+        self.thread = threading.Thread(target=lambda: asyncio.run(self.run()), name="net-client", daemon=True)
+
+    def connect(self, timeout=CONNECT_TIMEOUT):
+        """
+        connect and join the room
+        :param timeout: seconds
+        :return: (player number, rows, cols)
+        """
+        self.thread.start()
+        if not self.welcome.wait(timeout) or self.player is None:
+            raise ConnectionError(f"could not join room {self.room} on {self.host}:{self.port}")
+        return self.player, self.rows, self.cols
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        try:
+            reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            name = self.room.encode()
+            self.writer.write(encode(CLIENT_MESSAGES, JOIN, len(name)) + name)
+            while True:
+                message, fields = await receive(reader, SERVER_MESSAGES)
+                if message == WELCOME:
+                    self.player, self.rows, self.cols = fields
+                    self.welcome.set()
+                elif message == FULL:
+                    break
+                else:
+                    self.deliver(message, fields)
+        except (asyncio.IncompleteReadError, ConnectionError, KeyError):
+            pass  # disconnected or a broken message
+        finally:
+            self.welcome.set()
+            self.deliver(LEFT, (0,))  # player 0: the server is gone
+
+    def deliver(self, message, fields):
+        with self.lock:
+            if self.on_message is None:
+                self.pending.append((message, fields))
+                return
+        self.on_message(message, fields)
+
+    def listen(self, on_message):
+        """
+        start handing over server messages, starting with those that arrived before
+        :param on_message:
+        :return:
+        """
+        with self.lock:
+            self.on_message = on_message
+            pending, self.pending = self.pending, []
+        for message, fields in pending:
+            on_message(message, fields)
+
+    def send(self, message, *fields):
+        """
+        send from any thread
+        :return:
+        """
+        if self.loop is not None and self.writer is not None:
+            self.loop.call_soon_threadsafe(self.writer.write, encode(CLIENT_MESSAGES, message, *fields))
+
+    def select(self, index):
+        """
+        :param index:
+        :return: sequence number of the selection (echoed in its REVEAL or REJECT)
+        """
+        self.sequence += 1
+        self.send(SELECT, index, self.sequence)
+        return self.sequence
+
+    def restart(self):
+        self.send(RESTART)
+
+    def close(self):
+        if self.loop is not None and self.writer is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.writer.close)  # the loop is closed if the server hung up first
+
+
+def address(text):
+    """
+    parse a HOST:PORT argument
+    :param text:
+    :return: (host, port)
+    """
+    host, _, port = text.rpartition(":")
+    try:
+        return host or "127.0.0.1", int(port)
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected HOST:PORT, e.g. 127.0.0.1:5555")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="memory game server for networked 2 player games")
+    parser.add_argument("--host", default="127.0.0.1", help="interface to listen on (0.0.0.0 for the network)")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--board", type=board_size, default=(ROWS, COLS), help="board size, e.g. 8x8")
+    parser.add_argument("--resolve-time", type=float, default=RESOLVE_TIME,
+                        help="seconds after a mismatch before the next selection is accepted")
+    parser.add_argument("--match-resolve-time", type=float, default=MATCH_RESOLVE_TIME,
+                        help="seconds after a match before the next selection is accepted")
+    args = parser.parse_args()
+    server = Server(*args.board, args.resolve_time, args.match_resolve_time)
+    try:
+        asyncio.run(server.serve(args.host, args.port,
+                                 lambda port: print(f"serving on {args.host}:{port}", flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+
+from netplay import (CLIENT_MESSAGES, SERVER_MESSAGES, JOIN, SELECT, RESTART, WELCOME, START, REVEAL, RESULT,
+                     REJECT, GAME_OVER, LEFT, encode, receive)
+from simulation import MOVE_TIME
+from stats import percentile
+
+ROOMS = 100
+SECONDS = 10
+
+
+class Bot:
+    """
+    one player connection of the load test. it plays with perfect memory of every revealed card (both
+    players see every REVEAL) and times each selection until the server answers it
+    """
+
+    def __init__(self, room, rng, move_time):
+        self.room = room
+        self.rng = rng
+        self.move_time = move_time  # seconds to wait before each selection, 0 = as fast as possible
+        self.player = None
+        self.writer = None
+        self.sequence = 0
+        self.sent = {}  # sequence -> send time
+        self.round_trips = []
+        self.rejected = 0
+        self.games = 0
+        self.size = 0
+        self.reset(1)
+
+    def reset(self, turn):
+        self.turn = turn
+        self.seen = {}  # index -> card id, of cards not matched yet
+        self.matched = set()
+        self.selected = []
+
+    async def select(self, index):
+        if self.move_time:
+            await asyncio.sleep(self.move_time)
+        self.sequence += 1
+        self.sent[self.sequence] = time.perf_counter()
+        self.writer.write(encode(CLIENT_MESSAGES, SELECT, index, self.sequence))
+
+    def pick(self):
+        """
+        :return: index of the next card to turn
+        """
+        if self.selected:  # second card: the partner of the first one if it is known
+            first = self.selected[0]
+            for index, card_id in self.seen.items():
+                if card_id == self.seen[first] and index != first:
+                    return index
+        else:  # first card: one of a known pair
+            by_id = {}
+            for index, card_id in self.seen.items():
+                if card_id in by_id:
+                    return by_id[card_id]
+                by_id[card_id] = index
+        unseen = [index for index in range(self.size) if index not in self.seen and index not in self.matched]
+        return self.rng.choice(unseen)
+
+    async def play(self, host, port, until):
+        reader, self.writer = await asyncio.open_connection(host, port)
+        name = self.room.encode()
+        self.writer.write(encode(CLIENT_MESSAGES, JOIN, len(name)) + name)
+        try:
+            while time.perf_counter() < until:
+                try:
+                    message, fields = await asyncio.wait_for(receive(reader, SERVER_MESSAGES),
+                                                             until - time.perf_counter())
+                except asyncio.TimeoutError:
+                    break
+                if message == WELCOME:
+                    self.player, rows, cols = fields
+                    self.size = rows * cols
+                elif message == START:
+                    self.reset(fields[0])
+                    if self.turn == self.player:
+                        await self.select(self.pick())
+                elif message == REVEAL:
+                    index, card_id, sequence = fields
+                    self.answered(sequence)
+                    self.seen[index] = card_id
+                    self.selected.append(index)
+                    if len(self.selected) == 1 and self.turn == self.player:
+                        await self.select(self.pick())
+                elif message == RESULT:
+                    first, second, matched, self.turn = fields
+                    self.selected = []
+                    if matched:
+                        self.matched.update((first, second))
+                        del self.seen[first], self.seen[second]
+                    if self.turn == self.player and len(self.matched) < self.size:
+                        await self.select(self.pick())
+                elif message == REJECT:
+                    self.answered(fields[0])
+                    self.rejected += 1
+                elif message == GAME_OVER:
+                    self.games += 1
+                    if self.player == 1:
+                        self.writer.write(encode(CLIENT_MESSAGES, RESTART))
+                elif message == LEFT:
+                    break
+        finally:
+            self.writer.close()
+
+    def answered(self, sequence):
+        sent = self.sent.pop(sequence, None)
+        if sent is not None:
+            self.round_trips.append(time.perf_counter() - sent)
+
+
+async def run_rooms(host, port, rooms, seconds, move_time, seed):
+    """
+    :return: (round trip times, rejected selections, games finished)
+    """
+    rng = random.Random(seed)
+    bots = [Bot(f"load-{seed}-{room}", random.Random(rng.random()), move_time) for room in range(rooms) for _ in range(2)]
+    until = time.perf_counter() + seconds
+    await asyncio.gather(*(bot.play(host, port, until) for bot in bots))
+    round_trips = [rtt for bot in bots for rtt in bot.round_trips]
+    return round_trips, sum(bot.rejected for bot in bots), sum(bot.games for bot in bots) // 2
+
+
+def client_process(task):
+    return asyncio.run(run_rooms(*task))
+
+
+def process_cpu_seconds(pid):
+    """
+    :param pid:
+    :return: user + system cpu seconds used by a process so far (linux)
+    """
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def run(rooms=ROOMS, seconds=SECONDS, processes=1, move_time=0, board="4x4"):
+    """
+    start a server, play rooms * 2 bot connections against it and measure it
+    :param rooms: concurrent rooms
+    :param seconds: test duration
+    :param processes: client processes the bots are spread over
+    :param move_time: seconds each bot waits before a selection (0 = load the server as much as possible)
+    :param board: server board size
+    :return: summary dict
+    """
+    server = subprocess.Popen([sys.executable, "netplay.py", "--port", "0", "--resolve-time", "0", "--match-resolve-time", "0",
+                               "--board", board],
+                              stdout=subprocess.PIPE, text=True)
+    host, port = server.stdout.readline().split()[-1].rsplit(":", 1)
+    port = int(port)
+    cpu_start = process_cpu_seconds(server.pid)
+
+    tasks = [(host, port, rooms // processes + (number < rooms % processes), seconds, move_time, number)
+             for number in range(processes)]
+    start = time.perf_counter()
+    if processes == 1:
+        results = [client_process(tasks[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(client_process, tasks)
+    elapsed = time.perf_counter() - start
+    server_cpu = process_cpu_seconds(server.pid) - cpu_start
+    server.send_signal(signal.SIGINT)
+    server.wait()
+
+    round_trips = sorted(rtt for result in results for rtt in result[0])
+    moves = len(round_trips)
+    cpu_per_move = server_cpu / moves if moves else None
+    return {
+        "rooms": rooms,
+        "connections": 2 * rooms,
+        "seconds": elapsed,
+        "moves": moves,
+        "moves_per_sec": moves / elapsed,
+        "rejected": sum(result[1] for result in results),
+        "games": sum(result[2] for result in results),
+        "rtt_p50_ms": percentile(round_trips, 0.5) * 1000 if moves else None,
+        "rtt_p95_ms": percentile(round_trips, 0.95) * 1000 if moves else None,
+        "rtt_p99_ms": percentile(round_trips, 0.99) * 1000 if moves else None,
+        "server_cpu_percent": server_cpu / elapsed * 100,
+        "server_cpu_us_per_move": cpu_per_move * 1e6 if moves else None,
+        # a room with people in it turns a card every MOVE_TIME / 2 seconds
+        "rooms_per_core": MOVE_TIME / 2 / cpu_per_move if moves and cpu_per_move else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="load test for the netplay server (run from the game directory)")
+    parser.add_argument("--rooms", type=int, default=ROOMS, help="concurrent rooms (2 connections each)")
+    parser.add_argument("--seconds", type=float, default=SECONDS)
+    parser.add_argument("--processes", type=int, default=1, help="client processes running the bots")
+    parser.add_argument("--move-time", type=float, default=0,
+                        help=f"seconds each bot waits before a selection (0 = flat out, {MOVE_TIME / 2} = human pace)")
+    parser.add_argument("--board", default="4x4", help="board size, e.g. 8x8")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    summary = run(args.rooms, args.seconds, args.processes, args.move_time, args.board)
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
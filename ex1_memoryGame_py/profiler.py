@@ -0,0 +1,140 @@
+import csv
+import json
+import time
+from collections import deque
+
+FRAME_HISTORY = 600  # frames in the rolling window (10 s at 60 fps)
+HISTOGRAM_BUCKETS = 50  # 1 ms buckets of work time per frame, the last one collects everything slower
+WAIT_STAGES = ("wait",)  # time spent sleeping, not counted as frame work
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(samples, p):
+    """
+    nearest rank percentile
+    :param samples: sorted list
+    :param p: 0-100
+    :return: the sample below which p percent of the samples are, 0 for no samples
+    """
+    if not samples:
+        return 0
+    rank = max(0, -(-len(samples) * p // 100) - 1)
+    return samples[rank]
+
+
+def summarize(samples):
+    """
+    :param samples: seconds
+    :return: dict of p50/p95/p99/max/mean in milliseconds
+    """
+    ordered = sorted(samples)
+    summary = {f"p{p}": percentile(ordered, p) * 1000 for p in PERCENTILES}
+    summary["max"] = ordered[-1] * 1000 if ordered else 0
+    summary["mean"] = sum(ordered) / len(ordered) * 1000 if ordered else 0
+    return summary
+
+
+class NullProfiler:
+    """
+    stand-in used when profiling is off. every call is an empty method, so the instrumentation can stay
+    in the game loop
+    """
+    enabled = False
+
+    def start_frame(self):
+        pass
+
+    def mark(self, stage):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+class FrameProfiler:
+    """
+    times the stages of every frame. the game loop calls start_frame(), then mark(stage) after each
+    stage (the time since the previous mark is added to that stage) and end_frame(). the last
+    FRAME_HISTORY frames are kept for percentiles, dropped frames and the work time histogram are
+    counted over the whole session
+    """
+    enabled = True
+
+    def __init__(self, fps, history=FRAME_HISTORY):
+        self.budget = 1 / fps  # work time above this misses a frame
+        self.stages = {}  # stage name -> rolling seconds per frame
+        self.work = deque(maxlen=history)  # rolling seconds of work per frame
+        self.histogram = [0] * HISTOGRAM_BUCKETS
+        self.frames = 0
+        self.dropped = 0
+        self.current = {}
+        self.last = time.perf_counter()  # also when created in the middle of a frame
+
+    def start_frame(self):
+        self.current = {}
+        self.last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.current[stage] = self.current.get(stage, 0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        work = 0
+        for stage, seconds in self.current.items():
+            samples = self.stages.get(stage)
+            if samples is None:
+                # stages first seen now get zeros for the frames before, so all windows line up
+                samples = self.stages[stage] = deque([0] * len(self.work), maxlen=self.work.maxlen)
+            samples.append(seconds)
+            if stage not in WAIT_STAGES:
+                work += seconds
+        for stage, samples in self.stages.items():
+            if stage not in self.current:
+                samples.append(0)
+        self.work.append(work)
+        self.histogram[min(int(work * 1000), HISTOGRAM_BUCKETS - 1)] += 1
+        self.frames += 1
+        if work > self.budget:
+            self.dropped += 1
+
+    def report(self):
+        """
+        :return: dict with the frame and per stage statistics of the rolling window (milliseconds)
+        """
+        return {"frames": self.frames,
+                "dropped": self.dropped,
+                "budget_ms": self.budget * 1000,
+                "frame": summarize(self.work),
+                "stages": {stage: summarize(samples) for stage, samples in self.stages.items()},
+                "histogram_ms": self.histogram}
+
+    def overlay_lines(self):
+        """
+        :return: short text lines for the on-screen overlay
+        """
+        frame = summarize(self.work)
+        lines = [f"frame {frame['p50']:.2f}/{frame['p95']:.2f}/{frame['p99']:.2f} ms",
+                 f"dropped {self.dropped} of {self.frames}"]
+        for stage, samples in self.stages.items():
+            if stage not in WAIT_STAGES:
+                lines.append(f"{stage} p95 {summarize(samples)['p95']:.2f} ms")
+        return lines
+
+    def export(self, path):
+        """
+        write the report to path.json and the rolling window, one row per frame, to path.csv
+        :param path: file name without extension
+        :return:
+        """
+        with open(f"{path}.json", "w") as f:
+            json.dump(self.report(), f, indent=2)
+        stages = list(self.stages)
+        with open(f"{path}.csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "work_ms"] + [f"{stage}_ms" for stage in stages])
+            first = self.frames - len(self.work)
+            for row, work in enumerate(self.work):
+                writer.writerow([first + row, f"{work * 1000:.3f}"] +
+                                [f"{self.stages[stage][row] * 1000:.3f}" for stage in stages])
+        print(f"frame profile written to {path}.json and {path}.csv")
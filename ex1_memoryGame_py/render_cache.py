@@ -0,0 +1,99 @@
+from collections import OrderedDict
+
+import pygame
+
+MAX_CACHED_SURFACES = 256  # enough for every flip frame of a 4x4 deck, bounded when sizes or decks change
+MAX_CACHED_TEXTS = 128  # HUD, menu and overlay labels, old timer values drop out first
+
+
+class SurfaceCache:
+    """
+    least recently used cache of scaled surfaces in the display pixel format, keyed by (image, size).
+    every card image is scaled once per target size instead of once per frame
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_SURFACES):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+
+    def get(self, image, size):
+        """
+        scaled copy of an image, created on first use
+        :param image: source surface
+        :param size: (width, height)
+        :return: surface ready for fast blitting
+        """
+        key = (image, size)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = pygame.transform.scale(image, size)
+        if surface.get_flags() & pygame.SRCALPHA:
+            surface = surface.convert_alpha()
+        else:
+            surface = surface.convert()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)  # drop the least recently used surface
+        return surface
+
+    def preload(self, images, widths, height):
+        """
+        scale every image to every width up front (e.g. all steps of the flip animation)
+        :param images:
+        :param widths:
+        :param height:
+        :return:
+        """
+        for image in images:
+            for width in widths:
+                self.get(image, (width, height))
+
+    def clear(self):
+        """
+        forget all scaled surfaces (e.g. when the card size or the deck changes)
+        :return:
+        """
+        self.surfaces.clear()
+
+
+class TextCache:
+    """
+    least recently used cache of rendered text, keyed by (text, font, color). a label is rendered once
+    and reused until it drops out, so only text that changed (e.g. the timer seconds) is rendered again
+    """
+
+    def __init__(self, max_entries=MAX_CACHED_TEXTS):
+        self.max_entries = max_entries
+        self.surfaces = OrderedDict()
+
+    def get(self, text, font, color):
+        """
+        rendered (antialiased) text, created on first use
+        :param text:
+        :param font: pygame Font, created once by the caller
+        :param color:
+        :return: text surface
+        """
+        key = (text, font, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = font.render(text, True, color)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert_alpha()
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)  # drop the least recently used text
+        return surface
+
+    def clear(self):
+        """
+        forget all rendered text
+        :return:
+        """
+        self.surfaces.clear()
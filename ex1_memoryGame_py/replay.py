@@ -0,0 +1,151 @@
+import struct
+import time
+import zlib
+
+import pygame
+
+LOG_MAGIC = b"MEMREC1\0"
+LOG_HEADER = struct.Struct("<8sHHI")  # magic, rows, cols, session seed
+
+# every record is a one byte type followed by its fields
+FRAME = 0  # start of a frame (or menu wake-up): seconds since the session started
+TICK = 1  # end of a frame: milliseconds the frame took (the animation step) and a checksum of the game state
+CLICK = 2  # mouse button down: x, y, button
+KEY = 3  # key down: key code
+VOICE = 4  # voice command: command, card index
+QUIT = 5  # window closed
+RECORDS = {FRAME: struct.Struct("<d"), TICK: struct.Struct("<HI"), CLICK: struct.Struct("<HHB"),
+           KEY: struct.Struct("<I"), VOICE: struct.Struct("<BH"), QUIT: struct.Struct("")}
+
+VOICE_COMMANDS = ("card", "reset", "hint", "menu")
+NO_INDEX = 0xFFFF  # voice commands without a card
+
+
+class ReplayError(Exception):
+    pass
+
+
+def state_checksum(state):
+    """
+    :param state: GameState
+    :return: crc32 of everything on the board, the hints left and whose turn it is
+    """
+    crc = zlib.crc32(state.cards)
+    crc = zlib.crc32(state.revealed, crc)
+    crc = zlib.crc32(state.matched, crc)
+    return zlib.crc32(bytes((state.hints_remaining & 0xFF, state.player_turn)), crc)
+
+
+class Recorder:
+    """
+    writes a session log: the session seed (every game's layout follows from it) and, frame by frame, the
+    time, the input events the game reacts to and the frame time the animations advanced by
+    """
+
+    def __init__(self, path, rows, cols, seed, voice_event):
+        self.file = open(path, "wb")
+        self.file.write(LOG_HEADER.pack(LOG_MAGIC, rows, cols, seed))
+        self.voice_event = voice_event
+
+    def write(self, record, *fields):
+        self.file.write(bytes((record,)) + RECORDS[record].pack(*fields))
+
+    def frame(self, seconds, events):
+        """
+        :param seconds: time of the frame since the session started
+        :param events: the events the game is about to handle
+        :return:
+        """
+        self.write(FRAME, seconds)
+        for event in events:
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                self.write(CLICK, *event.pos, event.button)
+            elif event.type == pygame.KEYDOWN:
+                self.write(KEY, event.key)
+            elif event.type == self.voice_event:
+                self.write(VOICE, VOICE_COMMANDS.index(event.command),
+                           NO_INDEX if event.index is None else event.index)
+            elif event.type == pygame.QUIT:
+                self.write(QUIT)
+
+    def tick(self, milliseconds, checksum):
+        self.write(TICK, min(milliseconds, 0xFFFF), checksum)
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+class Replay:
+    """
+    reads a session log back frame by frame. in real time mode next_frame() waits until the frame is due,
+    otherwise frames come back to back. tick() compares the replayed game state with the recorded one
+    """
+
+    def __init__(self, path, voice_event, real_time=True):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        magic, self.rows, self.cols, self.seed = LOG_HEADER.unpack_from(self.data)
+        if magic != LOG_MAGIC:
+            raise ReplayError(f"{path} is not a session log")
+        self.offset = LOG_HEADER.size
+        self.voice_event = voice_event
+        self.real_time = real_time
+        self.start = None  # when the first frame was replayed, minus its recorded time
+        self.frames = 0
+        self.desync_frame = None  # first frame where the state differed from the recording
+
+    def peek(self):
+        return self.data[self.offset] if self.offset < len(self.data) else None
+
+    def read(self):
+        record = self.data[self.offset]
+        fields = RECORDS[record].unpack_from(self.data, self.offset + 1)
+        self.offset += 1 + RECORDS[record].size
+        return record, fields
+
+    def next_frame(self):
+        """
+        :return: (seconds since the session started, events) of the next frame, None at the end of the log
+        """
+        if self.peek() != FRAME:
+            return None
+        seconds, = self.read()[1]
+        events = []
+        while self.peek() not in (None, FRAME, TICK):
+            record, fields = self.read()
+            if record == CLICK:
+                x, y, button = fields
+                events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(x, y), button=button))
+            elif record == KEY:
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=fields[0], mod=0, unicode="", scancode=0))
+            elif record == VOICE:
+                command, index = fields
+                events.append(pygame.event.Event(self.voice_event, command=VOICE_COMMANDS[command],
+                                                 index=None if index == NO_INDEX else index))
+            elif record == QUIT:
+                events.append(pygame.event.Event(pygame.QUIT))
+        if self.start is None:
+            self.start = time.perf_counter() - seconds
+        if self.real_time:
+            time.sleep(max(0, self.start + seconds - time.perf_counter()))
+        self.frames += 1
+        return seconds, events
+
+    def tick(self, checksum):
+        """
+        :param checksum: state_checksum() of the replayed game at the end of the frame
+        :return: milliseconds the recorded frame took
+        """
+        if self.peek() != TICK:
+            raise ReplayError(f"the log is out of step with the game at frame {self.frames}")
+        milliseconds, recorded = self.read()[1]
+        if checksum != recorded and self.desync_frame is None:
+            self.desync_frame = self.frames
+            print(f"replay: the game state differs from the recording at frame {self.frames}")
+        return milliseconds
+
+    def close(self):
+        elapsed = time.perf_counter() - self.start if self.start is not None else 0
+        result = "in sync" if self.desync_frame is None else f"out of sync from frame {self.desync_frame}"
+        print(f"replay: {self.frames} frames in {elapsed:.2f} s, {result}")
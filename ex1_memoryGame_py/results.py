@@ -0,0 +1,245 @@
+import argparse
+import os
+import queue
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from engine import ROWS, COLS, board_size
+
+RESULTS_DB = "results.db"
+BATCH_SIZE = 500  # results written per transaction at most
+LEADERBOARD_SIZE = 10
+HISTORY_SIZE = 10
+
+# Game outcomes
+WON = "won"
+LOST = "lost"  # time attack ran out, or the other player found more pairs online
+ABANDONED = "abandoned"  # reset, back to the menu or quit in the middle of a game
+
+MODES = ("1_player", "2_players", "time_attack", "voice", "online")
+
+# Append only: results are inserted and never changed. the indexes cover the two queries the game makes,
+# so both read LEADERBOARD_SIZE / HISTORY_SIZE index entries however many results there are
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    played_at REAL NOT NULL,
+    player TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    rows INTEGER NOT NULL,
+    cols INTEGER NOT NULL,
+    outcome TEXT NOT NULL,
+    elapsed REAL NOT NULL,
+    time_limit REAL,
+    hints_used INTEGER NOT NULL,
+    moves INTEGER NOT NULL,
+    seed INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_leaderboard ON results (mode, rows, cols, outcome, elapsed);
+CREATE INDEX IF NOT EXISTS results_player ON results (player, played_at);
+"""
+COLUMNS = ("played_at", "player", "mode", "rows", "cols", "outcome", "elapsed", "time_limit", "hints_used", "moves",
+           "seed")
+INSERT = f"INSERT INTO results ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+
+
+class ResultStore:
+    """
+    game results in an sqlite database. add() only queues the result, a writer thread inserts whatever
+    is queued in one transaction, so the game loop never waits for the disk. queries run on the calling
+    thread with their own connection (WAL mode: reading doesn't block the writer)
+    """
+
+    def __init__(self, path=RESULTS_DB):
+        self.path = path
+        self.queue = queue.Queue()  # result tuples (in COLUMNS order), None stops the writer
+        self.ready = threading.Event()  # set once the schema exists
+        self.error = None  # why the database could not be opened
+        self.reader = None
+        self.thread = threading.Thread(target=self.write_batches, name="results-writer", daemon=True)
+        self.thread.start()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")  # WAL stays consistent, only the last commits may be lost
+        return connection
+
+    def write_batches(self):
+        """
+        writer thread: open the database, then insert queued results until None comes
+        :return:
+        """
+        try:
+            connection = self.connect()
+            connection.executescript(SCHEMA)
+        except sqlite3.Error as e:
+            self.error = e
+            print(f"results database unavailable ({e}), results are not saved")
+            connection = None
+        self.ready.set()
+
+        running = True
+        while running:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:  # everything that queued up meanwhile goes into the same transaction
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                running = False
+                batch = [result for result in batch if result is not None]
+            if batch and connection is not None:
+                try:
+                    with connection:
+                        connection.executemany(INSERT, batch)
+                except sqlite3.Error as e:
+                    print(f"could not save {len(batch)} results ({e})")
+            for _ in range(len(batch) + (not running)):
+                self.queue.task_done()
+        if connection is not None:
+            connection.close()
+
+    def add(self, player, mode, rows, cols, outcome, elapsed, time_limit=None, hints_used=0, moves=0, seed=0):
+        """
+        save the result of a game (in the background)
+        :param player: player name
+        :param mode: one of MODES
+        :param rows:
+        :param cols:
+        :param outcome: WON, LOST or ABANDONED
+        :param elapsed: seconds played
+        :param time_limit: time attack limit of the game, None in the other modes
+        :param hints_used:
+        :param moves: pairs turned over
+        :param seed: shuffle seed of the board
+        :return:
+        """
+        self.queue.put((time.time(), player, mode, rows, cols, outcome, elapsed, time_limit, hints_used, moves, seed))
+
+    def flush(self):
+        """
+        wait until every added result is written
+        :return:
+        """
+        self.queue.join()
+
+    def query(self, sql, parameters):
+        """
+        :return: result rows, after everything added so far is written
+        """
+        self.ready.wait()
+        if self.error is not None:
+            return []
+        self.flush()
+        if self.reader is None:
+            self.reader = sqlite3.connect(self.path)
+        return self.reader.execute(sql, parameters).fetchall()
+
+    def leaderboard(self, mode, rows, cols, limit=LEADERBOARD_SIZE):
+        """
+        fastest won games
+        :param mode:
+        :param rows:
+        :param cols:
+        :param limit:
+        :return: list of (player, elapsed, moves, hints used, played at)
+        """
+        return self.query("SELECT player, elapsed, moves, hints_used, played_at FROM results "
+                          "WHERE mode = ? AND rows = ? AND cols = ? AND outcome = ? ORDER BY elapsed LIMIT ?",
+                          (mode, rows, cols, WON, limit))
+
+    def history(self, player, limit=HISTORY_SIZE):
+        """
+        a player's latest games
+        :param player:
+        :param limit:
+        :return: list of (played at, mode, rows, cols, outcome, elapsed, moves), newest first
+        """
+        return self.query("SELECT played_at, mode, rows, cols, outcome, elapsed, moves FROM results "
+                          "WHERE player = ? ORDER BY played_at DESC LIMIT ?", (player, limit))
+
+    def close(self):
+        """
+        write what is still queued and stop the writer
+        :return:
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if self.reader is not None:
+            self.reader.close()
+
+
+def benchmark(sessions, players=1000, seed=0):
+    """
+    fill a temporary database with random results and time the writes and the game's queries
+    :param sessions: results to add
+    :param players: distinct player names
+    :param seed:
+    :return: summary dict
+    """
+    rng = random.Random(seed)
+    boards = ((4, 4), (6, 6), (8, 8))
+    with tempfile.TemporaryDirectory() as directory:
+        store = ResultStore(os.path.join(directory, RESULTS_DB))
+        start = time.perf_counter()
+        for _ in range(sessions):
+            rows, cols = rng.choice(boards)
+            store.add(f"player{rng.randrange(players)}", rng.choice(MODES), rows, cols,
+                      rng.choice((WON, WON, LOST, ABANDONED)), rng.uniform(10, 600), None, rng.randrange(4),
+                      rng.randrange(8, 200), rng.randrange(2 ** 32))
+        add_time = time.perf_counter() - start
+        store.flush()
+        write_time = time.perf_counter() - start
+
+        def timed(query, *args, repeat=100):
+            query(*args)  # first query opens the connection
+            query_start = time.perf_counter()
+            for _ in range(repeat):
+                query(*args)
+            return (time.perf_counter() - query_start) / repeat * 1000
+
+        summary = {
+            "sessions": sessions,
+            "add_us": add_time / sessions * 1e6,
+            "writes_per_sec": sessions / write_time,
+            "leaderboard_ms": timed(store.leaderboard, "1_player", 4, 4),
+            "history_ms": timed(store.history, "player0"),
+            "database_mb": os.path.getsize(store.path) / 2 ** 20,
+        }
+        store.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="show saved game results")
+    parser.add_argument("--db", default=RESULTS_DB)
+    parser.add_argument("--mode", choices=MODES, default=MODES[0])
+    parser.add_argument("--board", type=board_size, default=(ROWS, COLS), help="board size, e.g. 8x8")
+    parser.add_argument("--player", help="show this player's latest games instead of the leaderboard")
+    parser.add_argument("--benchmark", type=int, metavar="SESSIONS",
+                        help="time writing this many random results and the queries, in a temporary database")
+    args = parser.parse_args()
+
+    if args.benchmark:
+        for name, value in benchmark(args.benchmark).items():
+            print(f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}")
+        return
+    store = ResultStore(args.db)
+    if args.player:
+        for played_at, mode, rows, cols, outcome, elapsed, moves in store.history(args.player):
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(played_at))}  {mode} {rows}x{cols}  "
+                  f"{outcome}  {elapsed:.1f} s  {moves} moves")
+    else:
+        rows, cols = args.board
+        for place, (player, elapsed, moves, hints_used, _) in enumerate(store.leaderboard(args.mode, rows, cols), 1):
+            print(f"{place:2d}. {player}  {elapsed:.1f} s  {moves} moves  {hints_used} hints")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import time
+
+from engine import GameState, ROWS, COLS, INITIAL_TIME_LIMIT, TIME_LIMIT_DECREMENT, board_size
+from stats import percentile
+
+try:
+    import numpy as np
+except ImportError:  # the batched fast path is optional
+    np = None
+
+# two clicks with some thinking and the flip animations, plus the 1 s match check delay of the game
+MOVE_TIME = 2.8
+CHUNK_GAMES = 500  # games per task sent to a worker process
+STRATEGIES = ("random", "perfect", "limited")
+
+
+class RandomBot:
+    """
+    no memory at all: every card is a random hidden one
+    """
+
+    def __init__(self, rng):
+        self.rng = rng
+
+    def new_game(self, state):
+        pass
+
+    def observe(self, index, card_id, move):
+        pass
+
+    def wants_hint(self, move):
+        return False
+
+    def pick(self, state, move, first=None):
+        while True:
+            index = self.rng.choice(state.unmatched)
+            if not state.revealed[index]:
+                return index
+
+
+class MemoryBot:
+    """
+    remembers the cards it has seen. with decay < 1 every memory survives each move with probability
+    decay (a random lifetime is drawn when the card is seen), decay = 1 is perfect memory.
+    it turns up remembered pairs first, otherwise the first card it doesn't remember (board order)
+    """
+
+    def __init__(self, rng, decay=1.0):
+        self.rng = rng
+        self.decay = decay
+        self.memory = {}  # card id -> {index: move the memory is lost at}
+        self.pairs = []  # card ids with both cards remembered
+
+    def new_game(self, state):
+        self.memory = {}
+        self.pairs = []
+
+    def lifetime(self):
+        if self.decay >= 1:
+            return math.inf
+        return math.ceil(math.log(1 - self.rng.random()) / math.log(self.decay))
+
+    def observe(self, index, card_id, move):
+        seen = self.memory.setdefault(card_id, {})
+        seen[index] = move + self.lifetime()
+        if len(seen) == 2:
+            self.pairs.append(card_id)
+
+    def recall(self, state, card_id, move, exclude=None):
+        """
+        :return: a remembered, still hidden card with this id, or None
+        """
+        for index, forget_at in self.memory.get(card_id, {}).items():
+            if index != exclude and forget_at > move and not state.matched[index]:
+                return index
+        return None
+
+    def remembers(self, index, state, move):
+        forget_at = self.memory.get(state.cards[index], {}).get(index)
+        return forget_at is not None and forget_at > move
+
+    def wants_hint(self, move):
+        return not self.pairs
+
+    def pick(self, state, move, first=None):
+        if first is None:
+            while self.pairs:
+                card_id = self.pairs.pop()
+                index = self.recall(state, card_id, move)
+                if index is not None and self.recall(state, card_id, move, exclude=index) is not None:
+                    return index
+        else:
+            index = self.recall(state, state.cards[first], move, exclude=first)
+            if index is not None:
+                return index
+        for index in range(state.size):
+            if index != first and not state.matched[index] and not state.revealed[index] \
+                    and not self.remembers(index, state, move):
+                return index
+        # everything hidden is remembered (only possible for the second card)
+        return next(i for i in range(state.size) if not state.matched[i] and not state.revealed[i])
+
+
+def make_bot(strategy, rng, decay):
+    if strategy == "random":
+        return RandomBot(rng)
+    if strategy == "perfect":
+        return MemoryBot(rng)
+    if strategy == "limited":
+        return MemoryBot(rng, decay)
+    raise ValueError(f"unknown strategy: {strategy}")
+
+
+def play_game(bot, state, seed, use_hints=False):
+    """
+    play one single player game to the end with the same rules as the game window
+    :param bot:
+    :param state: GameState, reset with the seed
+    :param seed: board shuffle seed
+    :param use_hints: let the bot spend hints when it doesn't know a pair
+    :return: number of moves (pairs turned over)
+    """
+    state.reset(seed)
+    bot.new_game(state)
+    while not state.is_won():
+        move = state.moves
+        if use_hints and state.hints_remaining and bot.wants_hint(move):
+            index = state.hint()
+            if index is not None:
+                bot.observe(index, state.cards[index], move)
+        first = bot.pick(state, move)
+        state.select(first)
+        bot.observe(first, state.cards[first], move)
+        second = bot.pick(state, move, first)
+        state.select(second)
+        bot.observe(second, state.cards[second], move)
+        state.check_match()
+    return state.moves
+
+
+def simulate_chunk(task):
+    """
+    worker process entry point
+    :param task: (strategy, rows, cols, first seed, games, use_hints, decay)
+    :return: list of move counts
+    """
+    strategy, rows, cols, first_seed, games, use_hints, decay = task
+    bot = make_bot(strategy, random.Random(first_seed), decay)
+    state = GameState(rows, cols, num_players=1)
+    return [play_game(bot, state, seed, use_hints) for seed in range(first_seed, first_seed + games)]
+
+
+def perfect_moves_batch(task):
+    """
+    numpy fast path for the perfect memory bot without hints: a whole batch of boards is played at
+    once, one card position per step. every pair costs one matching move, so only the mismatches
+    (first card new, second card new and not its partner) have to be counted
+    :param task: (rows, cols, first seed, games)
+    :return: list of move counts
+    """
+    rows, cols, first_seed, games = task
+    size, pairs = rows * cols, rows * cols // 2
+    rng = np.random.default_rng(first_seed)
+    boards = rng.permuted(np.tile(np.repeat(np.arange(pairs), 2), (games, 1)), axis=1)
+
+    batch = np.arange(games)
+    position = np.zeros(games, dtype=np.int64)  # next card the bot hasn't seen
+    seen = np.zeros((games, pairs), dtype=bool)
+    mismatches = np.zeros(games, dtype=np.int64)
+    while True:
+        active = position < size
+        if not active.any():
+            break
+        board, at = batch[active], position[active]
+        first = boards[board, at]
+        known = seen[board, first]
+        # partner of the first card already seen: one matching move, one new card used
+        position[board[known]] += 1
+
+        new, at = board[~known], at[~known]
+        first = boards[new, at]
+        second = boards[new, np.minimum(at + 1, size - 1)]
+        mismatches[new] += first != second
+        seen[new, first] = True
+        seen[new, second] = True
+        position[new] += 2
+    return (mismatches + pairs).tolist()
+
+
+def time_attack_levels(times):
+    """
+    replay the time attack rules over consecutive games: each won game lowers the limit by
+    TIME_LIMIT_DECREMENT, the first game over the limit ends the run
+    :param times: completion time of every game, in play order
+    :return: number of games won in each run
+    """
+    runs = []
+    level, limit = 0, INITIAL_TIME_LIMIT
+    for seconds in times:
+        if seconds <= limit:
+            level += 1
+            limit -= TIME_LIMIT_DECREMENT
+            if limit > 0:
+                continue
+        runs.append(level)
+        level, limit = 0, INITIAL_TIME_LIMIT
+    return runs
+
+
+def report(strategy, moves, elapsed, move_time):
+    times = [count * move_time for count in moves]
+    levels = time_attack_levels(times)
+    return {
+        "strategy": strategy,
+        "games": len(moves),
+        "games_per_sec": len(moves) / elapsed,
+        "moves_mean": statistics.mean(moves),
+        "moves_p50": percentile(moves, 0.5),
+        "moves_p95": percentile(moves, 0.95),
+        "moves_min": min(moves),
+        "moves_max": max(moves),
+        "time_p5": percentile(times, 0.05),
+        "time_p50": percentile(times, 0.5),
+        "time_p95": percentile(times, 0.95),
+        "time_limit_win_rate": sum(seconds <= INITIAL_TIME_LIMIT for seconds in times) / len(times),
+        "time_attack_runs": len(levels),
+        "time_attack_levels_mean": statistics.mean(levels) if levels else 0,
+    }
+
+
+def run(strategy, games, rows=ROWS, cols=COLS, processes=None, seed=0, use_hints=False, decay=0.9,
+        use_numpy=True, move_time=MOVE_TIME):
+    """
+    play many games over a process pool
+    :return: report dict
+    """
+    chunks = [(seed + start, min(CHUNK_GAMES, games - start)) for start in range(0, games, CHUNK_GAMES)]
+    batched = use_numpy and np is not None and strategy == "perfect" and not use_hints
+    if batched:
+        worker, tasks = perfect_moves_batch, [(rows, cols, first, count) for first, count in chunks]
+    else:
+        worker = simulate_chunk
+        tasks = [(strategy, rows, cols, first, count, use_hints, decay) for first, count in chunks]
+
+    start = time.perf_counter()
+    moves = []
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap(worker, tasks):
+            moves.extend(result)
+    summary = report(strategy, moves, time.perf_counter() - start, move_time)
+    summary["numpy"] = batched
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="headless Monte-Carlo simulation of the memory game")
+    parser.add_argument("--strategy", choices=STRATEGIES + ("all",), default="all")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--board", type=board_size, default=(ROWS, COLS), help="board size, e.g. 8x8")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--hints", action="store_true", help="memory bots spend hints when they don't know a pair")
+    parser.add_argument("--decay", type=float, default=0.9, help="per move memory survival for the limited bot")
+    parser.add_argument("--move-time", type=float, default=MOVE_TIME, help="seconds per move")
+    parser.add_argument("--no-numpy", action="store_true", help="always play through the engine")
+    parser.add_argument("--json", help="write the reports to this file")
+    args = parser.parse_args()
+
+    rows, cols = args.board
+    strategies = STRATEGIES if args.strategy == "all" else (args.strategy,)
+    reports = []
+    for strategy in strategies:
+        summary = run(strategy, args.games, rows, cols, args.processes, args.seed, args.hints, args.decay,
+                      not args.no_numpy, args.move_time)
+        reports.append(summary)
+        print(f"{strategy:8} {summary['games_per_sec']:10.0f} games/s  "
+              f"moves mean {summary['moves_mean']:.1f} p50 {summary['moves_p50']} p95 {summary['moves_p95']}  "
+              f"time p50 {summary['time_p50']:.0f}s p95 {summary['time_p95']:.0f}s  "
+              f"win <= {INITIAL_TIME_LIMIT}s {summary['time_limit_win_rate']:.0%}  "
+              f"time attack levels {summary['time_attack_levels_mean']:.2f}"
+              f"{'  (numpy)' if summary['numpy'] else ''}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
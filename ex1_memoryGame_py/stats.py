@@ -0,0 +1,8 @@
+def percentile(values, fraction):
+    """
+    :param values: samples, in any order
+    :param fraction: 0-1, e.g. 0.95
+    :return: the sample at that fraction of the sorted samples
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,330 @@
+import json
+import math
+import operator
+import threading
+import time
+from array import array
+from collections import deque
+
+VOICE_MODEL = "vosk-model-small-en-us-0.15"
+SAMPLE_RATE = 16000  # vosk small models expect 16kHz mono audio
+CHUNK_SIZE = 4096  # frames read from the microphone per step
+LOW_LATENCY_CHUNK_SIZE = 800  # 50 ms steps so partial results are checked often
+STABLE_PARTIALS = 2  # a partial command must repeat this many steps in a row before acting on it
+
+# Voice activity gate: only audio around speech is decoded
+PRE_ROLL = 0.3  # seconds of audio before the gate opens that are decoded too (the start of the first word)
+HANGOVER = 0.4  # seconds the gate stays open after the last loud chunk, the recognizer needs the trailing silence
+SPEECH_RATIO = 3.0  # a chunk is speech when its level is this many times the noise floor
+MIN_SPEECH_LEVEL = 300  # and at least this loud (rms of 16 bit samples), so a silent room doesn't open the gate
+NOISE_ADAPT = 0.05  # how fast the noise floor follows the level of quiet chunks
+
+NUMBER_WORDS = ("one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten",
+                "eleven", "twelve", "thirteen", "fourteen", "fifteen", "sixteen")
+MENU_WORDS = ("reset", "hint", "menu")
+
+# "six" may still turn into "sixteen" while the word is being spoken, so wait longer for those
+PREFIX_WORDS = {word for word in NUMBER_WORDS if any(other != word and other.startswith(word) for other in NUMBER_WORDS)}
+
+
+def command_grammar():
+    """
+    the only phrases the recognizer may output in low latency mode
+    :return: list of phrases for KaldiRecognizer
+    """
+    return [f"number {word}" for word in NUMBER_WORDS] + list(MENU_WORDS) + ["[unk]"]
+
+
+def parse_command(text):
+    """
+    convert recognized text to a game command
+    :param text: audio text
+    :return: (command, card index) where command is "card" or one of MENU_WORDS, or None if not a command
+    """
+    parts = text.lower().split()
+    if len(parts) == 2 and parts[0] == "number" and parts[1] in NUMBER_WORDS:
+        return "card", NUMBER_WORDS.index(parts[1])
+    if len(parts) == 1 and parts[0] in MENU_WORDS:
+        return parts[0], None
+    return None
+
+
+def chunk_level(data):
+    """
+    :param data: 16 bit mono audio
+    :return: rms level
+    """
+    samples = array("h", data)
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(map(operator.mul, samples, samples)) / len(samples))
+
+
+class VoiceGate:
+    """
+    energy based voice activity gate in front of the recognizer. quiet chunks are only kept in a short
+    pre-roll ring (a deque of the chunks themselves, nothing is copied) and never decoded. once a chunk
+    is loud compared to the adaptive noise floor, the pre-roll and everything up to HANGOVER after the
+    last loud chunk go to the recognizer
+    """
+
+    def __init__(self, chunk_size, rate=SAMPLE_RATE):
+        chunk_time = chunk_size / rate
+        self.pre_roll = deque(maxlen=max(1, round(PRE_ROLL / chunk_time)))
+        self.hangover = max(1, round(HANGOVER / chunk_time))  # quiet chunks before the gate closes
+        self.noise = None  # noise floor (rms), learned from quiet chunks
+        self.open = False
+        self.quiet = 0  # quiet chunks in a row while open
+
+    def push(self, data):
+        """
+        :param data: next chunk of audio
+        :return: (chunks to decode now, True if a speech segment just ended)
+        """
+        level = chunk_level(data)
+        if self.noise is None:
+            self.noise = level
+        loud = level >= max(self.noise * SPEECH_RATIO, MIN_SPEECH_LEVEL)
+
+        if not self.open:
+            if not loud:
+                self.noise += NOISE_ADAPT * (level - self.noise)
+                self.pre_roll.append(data)
+                return (), False
+            self.open = True
+            self.quiet = 0
+            chunks = list(self.pre_roll) + [data]
+            self.pre_roll.clear()
+            return chunks, False
+
+        self.quiet = 0 if loud else self.quiet + 1
+        if self.quiet < self.hangover:
+            return (data,), False
+        self.open = False
+        return (data,), True
+
+    def reset(self):
+        """
+        close the gate and forget the pre-roll (the noise floor is kept)
+        :return:
+        """
+        self.open = False
+        self.quiet = 0
+        self.pre_roll.clear()
+
+
+class VoiceEngine:
+    """
+    long-lived voice control engine. the vosk model, the recognizer and the microphone stream are
+    created once and reused for every command until close() is called. capture and decoding run on
+    a background thread so the caller's render loop never waits for the microphone.
+
+    in low latency mode the recognizer is limited to command_grammar() and a command is acted on as
+    soon as it shows up stable in the partial results, without waiting for end of utterance silence.
+    with the voice gate on, the recognizer only sees the audio around speech
+    """
+
+    def __init__(self, model_path, rate=SAMPLE_RATE, low_latency=False, use_microphone=True, use_gate=True,
+                 model=None):
+        start = time.perf_counter()
+        self.rate = rate
+        self.low_latency = low_latency
+        self.chunk_size = LOW_LATENCY_CHUNK_SIZE if low_latency else CHUNK_SIZE
+
+        self.model = None
+        self.recognizer = None
+        self.open_recognizer(model_path, model)
+        self.last_partial = None
+        self.partial_count = 0
+        self.gate = VoiceGate(self.chunk_size, rate) if use_gate else None
+
+        # decoder cost: cpu seconds (of the calling thread) spent in the recognizer, and how much audio it got
+        self.decoder_time = 0.0
+        self.audio_bytes = 0
+        self.decoded_bytes = 0
+
+        self.mic = None
+        self.stream = None
+        if use_microphone:
+            self.open_microphone()
+
+        self.on_command = None  # callback receiving (command, index), called on the voice thread
+        self.listening = False
+        self.thread = None
+
+        self.startup_time = time.perf_counter() - start
+        self.command_latencies = []  # seconds from the last audio chunk of a command to the command
+        print(f"voice engine ready in {self.startup_time * 1000:.0f} ms")
+
+    def open_recognizer(self, model_path, model=None):
+        """
+        load the model and create the recognizer
+        :param model_path:
+        :param model: already loaded vosk Model to share (e.g. by the recognizer service), instead of loading one
+        :return:
+        """
+        from vosk import Model, KaldiRecognizer  # heavy, only imported once voice control is used
+
+        self.model = Model(model_path) if model is None else model
+        if self.low_latency:
+            self.recognizer = KaldiRecognizer(self.model, self.rate, json.dumps(command_grammar()))
+        else:
+            self.recognizer = KaldiRecognizer(self.model, self.rate)
+            self.recognizer.SetWords(True)
+
+    def open_microphone(self):
+        """
+        open the (paused) microphone input stream
+        :return:
+        """
+        import pyaudio
+
+        self.mic = pyaudio.PyAudio()
+        self.stream = self.mic.open(format=pyaudio.paInt16, channels=1, rate=self.rate, input=True,
+                                    frames_per_buffer=self.chunk_size * 2, start=False)
+
+    def process_audio(self, data):
+        """
+        next chunk from the microphone (or a recording): through the voice gate, if it is on, to the decoder
+        :param data: raw 16 bit mono audio
+        :return: (command, index) as soon as a command is recognized, otherwise None
+        """
+        self.audio_bytes += len(data)
+        if self.gate is None:
+            return self.process_chunk(data)
+        chunks, ended = self.gate.push(data)
+        command = None
+        for chunk in chunks:
+            command = self.process_chunk(chunk) or command
+        if ended:
+            command = self.flush() or command  # end of the speech segment, nothing more will come
+        return command
+
+    def process_chunk(self, data):
+        """
+        decode one chunk of 16 bit mono audio
+        :param data: raw audio bytes
+        :return: (command, index) as soon as a command is recognized, otherwise None
+        """
+        start = time.thread_time()
+        try:
+            return self.decode(data)
+        finally:
+            self.decoder_time += time.thread_time() - start
+            self.decoded_bytes += len(data)
+
+    def decode(self, data):
+        """
+        recognizer step for one chunk (see process_chunk)
+        :param data:
+        :return: (command, index) or None
+        """
+        if self.recognizer.AcceptWaveform(data):
+            self.last_partial = None
+            self.partial_count = 0
+            return parse_command(json.loads(self.recognizer.Result())["text"])
+        if not self.low_latency:
+            return None
+
+        partial = json.loads(self.recognizer.PartialResult())["partial"]
+        command = parse_command(partial)
+        if command is None:
+            self.last_partial = None
+            self.partial_count = 0
+            return None
+        if partial == self.last_partial:
+            self.partial_count += 1
+        else:
+            self.last_partial = partial
+            self.partial_count = 1
+
+        needed = STABLE_PARTIALS * 2 if partial.split()[-1] in PREFIX_WORDS else STABLE_PARTIALS
+        if self.partial_count < needed:
+            return None
+        # the command is taken, the rest of this utterance must not produce it again
+        self.reset()
+        return command
+
+    def flush(self):
+        """
+        finish the current utterance (e.g. at the end of a recording)
+        :return: (command, index) or None
+        """
+        start = time.thread_time()
+        command = parse_command(json.loads(self.recognizer.FinalResult())["text"])
+        self.reset()
+        self.decoder_time += time.thread_time() - start
+        return command
+
+    def reset(self):
+        """
+        drop any half-heard utterance
+        :return:
+        """
+        self.recognizer.Reset()
+        self.last_partial = None
+        self.partial_count = 0
+
+    def start(self, on_command):
+        """
+        start listening on a background thread
+        :param on_command: called with (command, index) for every recognized command (from the voice thread)
+        :return:
+        """
+        self.on_command = on_command
+        if self.thread is not None:
+            return
+        self.listening = True
+        self.stream.start_stream()
+        self.thread = threading.Thread(target=self.listen, name="voice-engine", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        stop listening and wait for the voice thread to finish. the model and stream stay open
+        :return:
+        """
+        if self.thread is None:
+            return
+        self.listening = False
+        self.thread.join()
+        self.thread = None
+        self.stream.stop_stream()
+        self.reset()
+        if self.gate is not None:
+            self.gate.reset()  # the pre-roll is stale when listening starts again
+
+    def listen(self):
+        """
+        voice thread loop: read the microphone and decode until stop() is called
+        :return:
+        """
+        while self.listening:
+            data = self.stream.read(self.chunk_size, exception_on_overflow=False)
+            if len(data) == 0:
+                break
+            chunk_time = time.perf_counter()
+            command = self.process_audio(data)
+            if command is not None:
+                latency = time.perf_counter() - chunk_time
+                self.command_latencies.append(latency)
+                print(f"{command} ({latency * 1000:.0f} ms)")
+                self.on_command(*command)
+
+    def close(self):
+        """
+        stop the microphone stream and release the audio device
+        :return:
+        """
+        self.stop()
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+            self.mic.terminate()
+        if self.command_latencies:
+            average = sum(self.command_latencies) / len(self.command_latencies)
+            print(f"voice engine: {len(self.command_latencies)} commands, "
+                  f"average latency {average * 1000:.0f} ms")
+        if self.audio_bytes:
+            print(f"voice engine: decoded {self.decoded_bytes / self.audio_bytes:.0%} of the audio, "
+                  f"decoder cpu {self.decoder_time:.1f} s")
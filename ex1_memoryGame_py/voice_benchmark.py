@@ -0,0 +1,282 @@
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import wave
+from array import array
+
+from stats import percentile
+from voice import VoiceEngine, VoiceGate, SAMPLE_RATE, VOICE_MODEL, parse_command
+
+ENERGY_FRAME = 160  # 10 ms frames for end of speech detection
+SPEECH_LEVEL = 0.1  # a frame counts as speech above this fraction of the loudest frame
+
+# Listening cost benchmark
+IDLE_PREFIX = "idle"  # fixtures of room noise without a command, e.g. idle_fan.wav
+LISTEN_SECONDS = 60  # length of the idle and the active play audio
+COMMAND_GAP = 3.0  # seconds of idle audio after each command in the active play audio
+NOISE_LEVEL = 60  # rms of the generated idle audio when there are no idle fixtures
+
+
+def load_wav(path):
+    """
+    read a recorded fixture
+    :param path: 16kHz mono 16 bit wav file
+    :return: raw audio bytes
+    """
+    with wave.open(path, "rb") as wav:
+        if wav.getframerate() != SAMPLE_RATE or wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: expected {SAMPLE_RATE} Hz mono 16 bit audio")
+        return wav.readframes(wav.getnframes())
+
+
+def end_of_speech(data):
+    """
+    find where the speaker stopped talking
+    :param data: raw audio bytes
+    :return: seconds from the start of the recording to the end of the last loud frame
+    """
+    samples = array("h", data)
+    levels = []
+    for start in range(0, len(samples), ENERGY_FRAME):
+        frame = samples[start:start + ENERGY_FRAME]
+        levels.append(math.sqrt(sum(s * s for s in frame) / len(frame)))
+    if not levels:
+        return 0.0
+    threshold = max(levels) * SPEECH_LEVEL
+    last = max(i for i, level in enumerate(levels) if level >= threshold)
+    return (last + 1) * ENERGY_FRAME / SAMPLE_RATE
+
+
+def expected_command(path, manifest):
+    """
+    the command a fixture should produce, from the manifest or from the file name
+    (e.g. "number_five.wav" or "reset-2.wav")
+    :param path:
+    :param manifest: {file name: phrase}
+    :return: (command, index)
+    """
+    name = os.path.basename(path)
+    phrase = manifest.get(name) or os.path.splitext(name)[0].split("-")[0].replace("_", " ")
+    return parse_command(phrase)
+
+
+def run_file(engine, path):
+    """
+    feed one recording through the engine in chunks, as if it was streamed live
+    :param engine:
+    :param path:
+    :return: (command, latency in seconds from end of speech to action, or None if nothing was recognized)
+    """
+    data = load_wav(path)
+    speech_end = end_of_speech(data)
+    engine.reset()
+    if engine.gate is not None:
+        engine.gate.reset()
+
+    chunk_bytes = engine.chunk_size * 2
+    for offset in range(0, len(data), chunk_bytes):
+        chunk = data[offset:offset + chunk_bytes]
+        start = time.perf_counter()
+        command = engine.process_audio(chunk)
+        decode_time = time.perf_counter() - start
+        if command is not None:
+            # live audio reaches the recognizer when its chunk is complete, then has to be decoded
+            chunk_end = (offset + len(chunk)) / 2 / SAMPLE_RATE
+            return command, chunk_end + decode_time - speech_end
+
+    start = time.perf_counter()
+    command = engine.flush()
+    if command is None:
+        return None, None
+    return command, len(data) / 2 / SAMPLE_RATE + time.perf_counter() - start - speech_end
+
+
+def idle_audio(fixtures, seconds):
+    """
+    background audio with nothing said: the idle fixtures if there are any, otherwise generated noise
+    :param fixtures:
+    :param seconds:
+    :return: raw audio bytes
+    """
+    files = sorted(os.path.join(fixtures, name) for name in os.listdir(fixtures)
+                   if name.startswith(IDLE_PREFIX) and name.endswith(".wav"))
+    if files:
+        data = b"".join(load_wav(path) for path in files)
+    else:
+        rng = random.Random(0)
+        data = array("h", (int(rng.gauss(0, NOISE_LEVEL)) for _ in range(SAMPLE_RATE))).tobytes()
+    size = int(seconds * SAMPLE_RATE) * 2
+    return (data * (size // len(data) + 1))[:size]
+
+
+def active_audio(files, seconds, idle):
+    """
+    audio of someone playing: the command fixtures one after another, COMMAND_GAP of idle audio after each
+    :param files: command fixtures
+    :param seconds:
+    :param idle: idle audio to take the gaps from
+    :return: raw audio bytes
+    """
+    gap = idle[:int(COMMAND_GAP * SAMPLE_RATE) * 2]
+    size = int(seconds * SAMPLE_RATE) * 2
+    parts, length = [], 0
+    while length < size:
+        for path in files:
+            parts += [load_wav(path), gap]
+            length += len(parts[-2]) + len(gap)
+    return b"".join(parts)[:size]
+
+
+def resident_memory():
+    """
+    :return: resident set size of this process in MB (linux)
+    """
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def listen(engine, data, use_gate):
+    """
+    stream audio through the engine like the listen thread does and measure what it cost
+    :param engine:
+    :param data: raw audio bytes
+    :param use_gate: decode everything, or only what the voice gate lets through
+    :return: summary dict, per minute of audio
+    """
+    engine.gate = VoiceGate(engine.chunk_size) if use_gate else None
+    engine.reset()
+    engine.decoder_time = 0.0
+    engine.audio_bytes = engine.decoded_bytes = 0
+    memory_start = resident_memory()
+
+    commands = 0
+    chunk_bytes = engine.chunk_size * 2
+    start = time.thread_time()
+    for offset in range(0, len(data), chunk_bytes):
+        if engine.process_audio(data[offset:offset + chunk_bytes]) is not None:
+            commands += 1
+    if engine.flush() is not None:
+        commands += 1
+    cpu_time = time.thread_time() - start
+
+    minutes = len(data) / 2 / SAMPLE_RATE / 60
+    memory = resident_memory()
+    return {
+        "commands": commands,
+        "decoded_fraction": engine.decoded_bytes / engine.audio_bytes,
+        "decoder_cpu_s_per_min": engine.decoder_time / minutes,
+        "total_cpu_s_per_min": cpu_time / minutes,
+        "rss_mb": memory,
+        "rss_growth_mb_per_min": (memory - memory_start) / minutes,
+    }
+
+
+def run_listening(fixtures, low_latency=True, seconds=LISTEN_SECONDS, verbose=True):
+    """
+    decoder cpu time and memory for a minute of idle listening and a minute of active play, with and
+    without the voice gate
+    :param fixtures: directory with recorded commands (and optionally idle*.wav room noise)
+    :param low_latency:
+    :param seconds: length of each audio stream
+    :param verbose: print one line per run
+    :return: summary dict
+    """
+    files = sorted(os.path.join(fixtures, name) for name in os.listdir(fixtures)
+                   if name.endswith(".wav") and not name.startswith(IDLE_PREFIX))
+    idle = idle_audio(fixtures, seconds)
+    streams = {"idle": idle}
+    if files:
+        streams["active"] = active_audio(files, seconds, idle)
+
+    engine = VoiceEngine(VOICE_MODEL, low_latency=low_latency, use_microphone=False)
+    summary = {"mode": "low_latency" if low_latency else "open_vocabulary", "seconds": seconds,
+               "model_rss_mb": resident_memory()}
+    for name, data in streams.items():
+        for use_gate in (False, True):
+            run = f"{name}_{'gated' if use_gate else 'ungated'}"
+            summary[run] = listen(engine, data, use_gate)
+            if verbose:
+                print(f"{run}: decoded {summary[run]['decoded_fraction']:.0%}, "
+                      f"decoder {summary[run]['decoder_cpu_s_per_min']:.2f} cpu s/min, "
+                      f"{summary[run]['commands']} commands, rss {summary[run]['rss_mb']:.0f} MB")
+    engine.close()
+    return summary
+
+
+def run_benchmark(fixtures, low_latency=True, manifest=None, verbose=True):
+    """
+    run every wav fixture in a directory through the voice pipeline
+    :param fixtures: directory with recorded commands
+    :param low_latency: constrained grammar with partial results, or open vocabulary with final results
+    :param manifest: optional {file name: phrase}, otherwise the phrase comes from the file name
+    :param verbose: print one line per file
+    :return: summary dict
+    """
+    manifest = manifest or {}
+    files = sorted(os.path.join(fixtures, name) for name in os.listdir(fixtures)
+                   if name.endswith(".wav") and not name.startswith(IDLE_PREFIX))
+    engine = VoiceEngine(VOICE_MODEL, low_latency=low_latency, use_microphone=False)
+
+    latencies = []
+    correct = 0
+    for path in files:
+        expected = expected_command(path, manifest)
+        command, latency = run_file(engine, path)
+        if command == expected:
+            correct += 1
+        if latency is not None:
+            latencies.append(latency)
+        if verbose:
+            shown = "-" if latency is None else f"{latency * 1000:.0f} ms"
+            print(f"{os.path.basename(path)}: {command} (expected {expected}) {shown}")
+
+    summary = {
+        "mode": "low_latency" if low_latency else "open_vocabulary",
+        "files": len(files),
+        "accuracy": correct / len(files) if files else None,
+        "model_load_ms": engine.startup_time * 1000,
+    }
+    if latencies:
+        summary.update({
+            "latency_mean_ms": statistics.mean(latencies) * 1000,
+            "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+            "latency_p95_ms": percentile(latencies, 0.95) * 1000,
+        })
+    engine.close()
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="offline voice command latency and accuracy benchmark")
+    parser.add_argument("fixtures", help="directory of 16kHz mono wav files named after their phrase")
+    parser.add_argument("--manifest", help="json file mapping wav file names to phrases")
+    parser.add_argument("--open-vocabulary", action="store_true", help="benchmark the old final-result decoding")
+    parser.add_argument("--listening", action="store_true",
+                        help="measure decoder cpu and memory per minute of idle listening and of active play")
+    parser.add_argument("--seconds", type=float, default=LISTEN_SECONDS, help="audio length for --listening")
+    parser.add_argument("--json", help="write the summary to this file")
+    args = parser.parse_args()
+
+    manifest = None
+    if args.manifest:
+        with open(args.manifest) as f:
+            manifest = json.load(f)
+
+    if args.listening:
+        summary = run_listening(args.fixtures, low_latency=not args.open_vocabulary, seconds=args.seconds)
+    else:
+        summary = run_benchmark(args.fixtures, low_latency=not args.open_vocabulary, manifest=manifest)
+    print(json.dumps(summary, indent=2))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 0 if summary.get("files", 1) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+from voice import VoiceEngine, VOICE_MODEL, MENU_WORDS
+
+PORT = 5556
+CONNECT_TIMEOUT = 5
+COMMANDS = ("card",) + MENU_WORDS  # command numbers on the wire
+
+# Game -> service messages: type byte and a 32 bit value
+HELLO = 1  # value: 1 for the low latency recognizer, 0 for open vocabulary
+AUDIO = 2  # value: length of the 16 bit mono audio that follows
+END = 3  # end of a speech segment, finish the utterance
+RESET = 4  # drop the utterance
+REQUEST = struct.Struct("<BI")
+
+# Service -> game messages
+COMMAND = 1  # command number, card index + 1 (0 for commands without a card)
+RESPONSE = struct.Struct("<BBH")
+
+
+class RecognizerService:
+    """
+    one vosk model for every game on the host. the model (the big part, tens of MB) is loaded once, each
+    connection gets its own small recognizer on it. decoding runs on executor threads, so one game
+    speaking doesn't hold up the others
+    """
+
+    def __init__(self, model_path=VOICE_MODEL):
+        start = time.perf_counter()
+        from vosk import Model  # heavy, like in VoiceEngine
+
+        self.model_path = model_path
+        self.model = Model(model_path)
+        self.connections = 0
+        print(f"model loaded in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    async def handle(self, reader, writer):
+        """
+        one game connection: HELLO first, then audio until the connection closes
+        :param reader:
+        :param writer:
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        self.connections += 1
+        try:
+            message, low_latency = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+            if message != HELLO:
+                return
+            engine = VoiceEngine(self.model_path, low_latency=bool(low_latency), use_microphone=False,
+                                 use_gate=False, model=self.model)  # the game gates its audio before sending
+            while True:
+                message, value = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                if message == AUDIO:
+                    data = await reader.readexactly(value)
+                    command = await loop.run_in_executor(None, engine.process_chunk, data)
+                elif message == END:
+                    command = await loop.run_in_executor(None, engine.flush)
+                elif message == RESET:
+                    engine.reset()
+                    command = None
+                else:
+                    break
+                if command is not None:
+                    name, index = command
+                    writer.write(RESPONSE.pack(COMMAND, COMMANDS.index(name), 0 if index is None else index + 1))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # the game closed
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve(self, host, port, ready=None):
+        """
+        :param host:
+        :param port: 0 picks a free port
+        :param ready: called with the port once the service listens
+        :return:
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        port = server.sockets[0].getsockname()[1]
+        if ready is not None:
+            ready(port)
+        async with server:
+            await server.serve_forever()
+
+
+class RemoteVoiceEngine(VoiceEngine):
+    """
+    voice engine of a game using the recognizer service. the microphone and the voice gate stay in the
+    game, only the gated speech is sent over the local socket and the commands come back on a receiver
+    thread. the game doesn't load the model at all
+    """
+
+    def __init__(self, address, low_latency=False, use_microphone=True):
+        self.address = address
+        self.socket = None
+        super().__init__(None, low_latency=low_latency, use_microphone=use_microphone, use_gate=True)
+
+    def open_recognizer(self, model_path, model=None):
+        """
+        connect to the service instead of loading a model
+        :param model_path: unused
+        :param model: unused
+        :return:
+        """
+        self.socket = socket.create_connection(self.address, CONNECT_TIMEOUT)
+        self.socket.settimeout(None)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.socket.sendall(REQUEST.pack(HELLO, self.low_latency))
+        threading.Thread(target=self.receive, name="voice-service", daemon=True).start()
+
+    def receive(self):
+        """
+        receiver thread: hand every command from the service to on_command while listening
+        :return:
+        """
+        stream = self.socket.makefile("rb")
+        while True:
+            data = stream.read(RESPONSE.size)
+            if len(data) < RESPONSE.size:
+                break  # the service or this engine closed the connection
+            _, number, index = RESPONSE.unpack(data)
+            command = COMMANDS[number], index - 1 if index else None
+            if self.listening and self.on_command is not None:
+                self.on_command(*command)
+
+    def send(self, data):
+        try:
+            self.socket.sendall(data)
+        except OSError:
+            pass  # the service is gone, voice commands stop
+
+    def process_chunk(self, data):
+        """
+        send one chunk of speech, its command (if any) arrives on the receiver thread
+        :param data:
+        :return: None
+        """
+        self.decoded_bytes += len(data)
+        self.send(REQUEST.pack(AUDIO, len(data)) + data)
+        return None
+
+    def flush(self):
+        self.send(REQUEST.pack(END, 0))
+        return None
+
+    def reset(self):
+        self.last_partial = None
+        self.partial_count = 0
+        self.send(REQUEST.pack(RESET, 0))
+
+    def close(self):
+        super().close()
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="voice recognizer service shared by the games on this host")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--model", default=VOICE_MODEL, help="vosk model directory")
+    args = parser.parse_args()
+
+    service = RecognizerService(args.model)
+    try:
+        asyncio.run(service.serve(args.host, args.port,
+                                  lambda port: print(f"serving on {args.host}:{port}", flush=True)))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()